@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from synthetic import GEOMETRY_TYPES, make_meta, make_datasets
+from fake_api import FakeApi
+from bench_pipeline import WORKSPACE_ID, setup_app_env
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batch mode: several projects converted in one process')
+    parser.add_argument('--projects', type=int, default=8)
+    parser.add_argument('--images', type=int, default=200, help='images per project')
+    parser.add_argument('--labels-per-image', type=int, default=10)
+    parser.add_argument('--tags', type=int, default=10)
+    parser.add_argument('--selected-tags', type=int, default=5)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES), default='polygon')
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--failing-project', action='store_true',
+                        help='add a project without most of the selected tags')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per request')
+    parser.add_argument('--bandwidth', type=float, default=50e6, help='bytes per second')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app settings')
+    return parser.parse_args()
+
+
+def measure_startup_seconds() -> float:
+    # what every project pays when converted by a separate app process
+    code = 'import time; t0 = time.perf_counter(); import main; print(time.perf_counter() - t0)'
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True, env=os.environ)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    meta = make_meta(args.tags, geometry=args.geometry)
+    api = FakeApi(latency=args.latency, bandwidth=args.bandwidth)
+    project_ids = []
+    for i in range(args.projects):
+        datasets = make_datasets(meta, args.images, 2, args.labels_per_image, seed=i)
+        project_ids.append(api.add_project(WORKSPACE_ID, f'synthetic_{i}', meta.to_json(), datasets).id)
+    if args.failing_project:
+        other_meta = make_meta(1, geometry=args.geometry)
+        datasets = make_datasets(other_meta, args.images, 2, args.labels_per_image)
+        project_ids.append(api.add_project(WORKSPACE_ID, 'one_tag', other_meta.to_json(), datasets).id)
+
+    selected_tags = [t.name for t in meta.tag_metas][:args.selected_tags]
+    setup_app_env(project_ids[0], selected_tags, 'create', False, args.env)
+    startup_seconds = measure_startup_seconds()
+
+    import batch
+    import globals as g
+
+    results = {'startup_seconds_per_process': startup_seconds}
+    for in_flight in args.in_flight:
+        g.stats_cache_dir = tempfile.mkdtemp(prefix='stats_cache_')   # every run starts cold
+        t0 = time.perf_counter()
+        report = batch.convert_batch(api, project_ids, selected_tags, in_flight)
+        total_seconds = time.perf_counter() - t0
+        results[f'in_flight_{in_flight}'] = {
+            'total_seconds': total_seconds,
+            'images_per_second': report['images_cnt'] / total_seconds,
+            'failed_cnt': report['failed_cnt'],
+            'projects': [{k: res[k] for k in ('project_id', 'status', 'error', 'seconds', 'images_per_second')}
+                         for res in report['projects']],
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import time
+import argparse
+
+import supervisely as sly
+
+from synthetic import GEOMETRY_TYPES, make_meta, make_ann_jsons
+from ann_convertor import AnnConvertor
+
+
+def make_res_meta(meta: sly.ProjectMeta, tags_to_convert) -> sly.ProjectMeta:
+    geometry_type = next(iter(meta.obj_classes)).geometry_type
+    new_classes = [sly.ObjClass(t, geometry_type) for t in tags_to_convert]
+    res_tags = [t.clone() for t in meta.tag_metas if t.name not in tags_to_convert]
+    return meta.clone(obj_classes=meta.obj_classes.add_items(new_classes), tag_metas=sly.TagMetaCollection(res_tags))
+
+
+def check_equal(convertor: AnnConvertor, meta: sly.ProjectMeta, ann_jsons) -> None:
+    for idx, ann_json in enumerate(ann_jsons):
+        by_objects = convertor.convert(sly.Annotation.from_json(ann_json, meta)).to_json()
+        multiple_by_objects = convertor.multiple_tags_converted
+        by_json = convertor.convert_json(ann_json)
+        if by_objects != by_json or multiple_by_objects != convertor.multiple_tags_converted:
+            raise AssertionError(f'Json conversion differs from object conversion. Annotation index: {idx}')
+
+
+def bench(name: str, func, ann_jsons) -> float:
+    t0 = time.perf_counter()
+    for ann_json in ann_jsons:
+        func(ann_json)
+    elapsed = time.perf_counter() - t0
+    print(f'{name:<28} {elapsed:8.3f} s  {len(ann_jsons) / elapsed:10.1f} anns/s')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Annotation conversion: sly.Annotation objects vs raw jsons')
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--labels-per-image', type=int, default=20)
+    parser.add_argument('--obj-size', type=int, default=128)
+    parser.add_argument('--tags', type=int, default=10)
+    parser.add_argument('--tags-per-label', type=float, default=1.5)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES), default='bitmap')
+    args = parser.parse_args()
+
+    meta = make_meta(args.tags, geometry=args.geometry)
+    ann_jsons = make_ann_jsons(meta, args.images, args.labels_per_image, obj_size=args.obj_size,
+                               tags_per_label=args.tags_per_label)
+    tags_to_convert = [t.name for t in meta.tag_metas][:args.tags // 2 + 1]
+    res_meta = make_res_meta(meta, tags_to_convert)
+
+    for handle_option in ('ignore', 'create'):
+        convertor = AnnConvertor(tags_to_convert, src_meta=meta, res_meta=res_meta, handle_option=handle_option)
+        check_equal(convertor, meta, ann_jsons)
+        print(f'{handle_option=}: json conversion output is identical to object conversion')
+
+        t_obj = bench('from_json + convert + to_json', lambda j: convertor.convert(
+            sly.Annotation.from_json(j, meta)).to_json(), ann_jsons)
+        t_json = bench('convert_json', convertor.convert_json, ann_jsons)
+        print(f'speedup: {t_obj / t_json:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
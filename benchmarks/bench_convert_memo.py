@@ -0,0 +1,44 @@
+import argparse
+
+import supervisely as sly
+
+from synthetic import GEOMETRY_TYPES, make_meta, make_ann_jsons
+from bench_convert import make_res_meta, bench
+from ann_convertor import AnnConvertor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Label rewrite memo of AnnConvertor on label-dense images')
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--labels-per-image', type=int, default=1000)
+    parser.add_argument('--obj-size', type=int, default=8)
+    parser.add_argument('--tags', type=int, default=10)
+    parser.add_argument('--tags-per-label', type=float, default=2.0)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES), default='point')
+    args = parser.parse_args()
+
+    meta = make_meta(args.tags, geometry=args.geometry)
+    ann_jsons = make_ann_jsons(meta, args.images, args.labels_per_image, obj_size=args.obj_size,
+                               tags_per_label=args.tags_per_label)
+    anns = [sly.Annotation.from_json(ann_json, meta) for ann_json in ann_jsons]
+    tags_to_convert = [t.name for t in meta.tag_metas][:args.tags // 2 + 1]
+    res_meta = make_res_meta(meta, tags_to_convert)
+
+    for handle_option in ('ignore', 'create'):
+        print(f'{handle_option=}')
+        plain = AnnConvertor(tags_to_convert, src_meta=meta, res_meta=res_meta, handle_option=handle_option,
+                             memo_size=0)
+        memo = AnnConvertor(tags_to_convert, src_meta=meta, res_meta=res_meta, handle_option=handle_option)
+        for ann in anns[:10]:
+            assert plain.convert(ann).to_json() == memo.convert(ann).to_json()
+
+        t_plain = bench('convert, no memo', plain.convert, anns)
+        t_memo = bench('convert, memo', memo.convert, anns)
+        print(f'speedup: {t_plain / t_memo:.2f}x')
+        t_plain = bench('convert_json, no memo', plain.convert_json, ann_jsons)
+        t_memo = bench('convert_json, memo', memo.convert_json, ann_jsons)
+        print(f'speedup: {t_plain / t_memo:.2f}x  memo: {memo.memo_counters}')
+
+
+if __name__ == '__main__':
+    main()
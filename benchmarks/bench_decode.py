@@ -0,0 +1,62 @@
+import os
+import time
+import pickle
+import argparse
+from multiprocessing.reduction import ForkingPickler
+
+import supervisely as sly
+
+from synthetic import GEOMETRY_TYPES, make_meta, make_ann_jsons
+from ann_decoder import AnnDecoderPool, register_reducers
+
+
+def bench(name: str, decode, ann_jsons) -> float:
+    t0 = time.perf_counter()
+    anns = list(decode(ann_jsons))
+    elapsed = time.perf_counter() - t0
+    assert len(anns) == len(ann_jsons)
+    print(f'{name:<28} {elapsed:8.3f} s  {len(ann_jsons) / elapsed:10.1f} anns/s')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Annotation decoding: app process vs process pool')
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--labels-per-image', type=int, default=20)
+    parser.add_argument('--obj-size', type=int, default=256)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES), default='bitmap')
+    parser.add_argument('--processes', type=int, nargs='+', default=None, help='default: 1, 2, 4 ... cpu count')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[4, 16, 64])
+    args = parser.parse_args()
+
+    meta = make_meta(5, geometry=args.geometry)
+    ann_jsons = make_ann_jsons(meta, args.images, args.labels_per_image, obj_size=args.obj_size)
+    processes_cnts = args.processes
+    if processes_cnts is None:
+        processes_cnts = [2 ** i for i in range(os.cpu_count().bit_length()) if 2 ** i <= os.cpu_count()]
+
+    t_single = bench('from_json', lambda jsons: (sly.Annotation.from_json(j, meta) for j in jsons), ann_jsons)
+
+    # the app process unpickles every decoded annotation, the pool can not be faster than that on any core count
+    register_reducers()
+    data = bytes(ForkingPickler.dumps([sly.Annotation.from_json(j, meta) for j in ann_jsons]))
+    t0 = time.perf_counter()
+    pickle.loads(data)
+    t_receive = time.perf_counter() - t0
+    print(f'{"unpickle in app process":<28} {t_receive:8.3f} s  {len(data) / 1e6:10.1f} MB')
+    print(f'speedup bound: {t_single / t_receive:.1f}x, cpu count: {os.cpu_count()}')
+    for chunk_size in args.chunk_sizes:
+        for processes in processes_cnts:
+            pool = AnnDecoderPool(meta, processes, chunk_size=chunk_size)
+            try:
+                if processes == processes_cnts[0]:
+                    assert [a.to_json() for a in pool.decode(ann_jsons[:chunk_size + 1])] == \
+                           [sly.Annotation.from_json(j, meta).to_json() for j in ann_jsons[:chunk_size + 1]]
+                t_pool = bench(f'pool {processes=} {chunk_size=}', pool.decode, ann_jsons)
+            finally:
+                pool.close()
+            print(f'speedup: {t_single / t_pool:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
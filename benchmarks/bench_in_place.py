@@ -0,0 +1,44 @@
+import sys
+import json
+import argparse
+import subprocess
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Throughput of in-place conversion compared to copy mode. '
+                                                 'Unknown arguments are passed to bench_pipeline.py')
+    parser.add_argument('--repeats', type=int, default=1)
+    return parser.parse_known_args()
+
+
+def run_pipeline_bench(bench_args) -> dict:
+    # every run needs a fresh process: app settings are read from env on import
+    cmd = [sys.executable, 'bench_pipeline.py', '--json', *bench_args]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def summary(report: dict) -> dict:
+    return {
+        'total_seconds': report['total_seconds'],
+        'images_per_second': report['images_per_second'],
+        'anns_uploaded': report['counters'].get('anns_uploaded', 0),
+        'anns_unchanged': report['counters'].get('anns_unchanged', 0),
+        'anns_copied': report['counters'].get('anns_copied', 0),
+        'images_uploaded': report['counters'].get('images_uploaded', 0),
+        'bytes_sent': report['bytes_sent'],
+        'requests': sum(report['requests'].values()),
+    }
+
+
+def main():
+    args, bench_args = parse_args()
+    for _ in range(args.repeats):
+        copy_report = summary(run_pipeline_bench(bench_args))
+        in_place_report = summary(run_pipeline_bench([*bench_args, '--in-place']))
+        speedup = copy_report['total_seconds'] / in_place_report['total_seconds']
+        print(json.dumps({'copy': copy_report, 'in_place': in_place_report, 'speedup': speedup}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+
+from synthetic import GEOMETRY_TYPES, make_meta, make_datasets
+from fake_api import FakeApi
+from fake_http_server import FakeHttpServer
+
+
+WORKSPACE_ID = 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='tags_to_classes end to end against an in-process fake API')
+    parser.add_argument('--images', type=int, default=1000)
+    parser.add_argument('--datasets', type=int, default=2)
+    parser.add_argument('--labels-per-image', type=int, default=10)
+    parser.add_argument('--tags', type=int, default=10)
+    parser.add_argument('--selected-tags', type=int, default=5, help='how many of the tags are converted')
+    parser.add_argument('--tags-per-label', type=float, default=1.0)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES), default='polygon')
+    parser.add_argument('--obj-size', type=int, default=64)
+    parser.add_argument('--handle-option', choices=['none', 'ignore', 'create'], default='create')
+    parser.add_argument('--in-place', action='store_true', help='convert the source project in place')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per request')
+    parser.add_argument('--bandwidth', type=float, default=50e6, help='bytes per second')
+    parser.add_argument('--async-io', action='store_true',
+                        help='bulk annotation I/O over HTTP to a local server backed by the fake API')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of HTTP requests answered with 503')
+    parser.add_argument('--lost-reply-rate', type=float, default=0.0,
+                        help='share of HTTP requests processed, but answered with 504')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app settings')
+    parser.add_argument('--json', action='store_true', help='print the report as a single json line')
+    return parser.parse_args()
+
+
+def setup_app_env(project_id: int, selected_tags, handle_option: str, in_place: bool, extra_env):
+    tmp_dir = tempfile.mkdtemp(prefix='tags_to_classes_bench_')
+    os.environ.update({
+        'TASK_ID': '0',
+        'context.teamId': '1',
+        'context.workspaceId': str(WORKSPACE_ID),
+        'modal.state.slyProjectId': str(project_id),
+        'modal.state.selectedTags.tags': json.dumps(selected_tags),
+        'modal.state.handleMulti': 'false' if handle_option == 'none' else 'true',
+        'modal.state.handleOption': handle_option,
+        'modal.state.inPlace': str(in_place).lower(),
+        'SERVER_ADDRESS': 'http://localhost',
+        'API_TOKEN': 'x' * 128,
+        'DEBUG_APP_DIR': os.path.join(tmp_dir, 'data'),
+        'DEBUG_TEMPORARY_APP_DIR': os.path.join(tmp_dir, 'temp'),
+        'RESUMABLE': 'false',
+    })
+    for item in extra_env:
+        key, value = item.split('=', 1)
+        os.environ[key] = value
+
+
+def main():
+    args = parse_args()
+
+    t0 = time.perf_counter()
+    meta = make_meta(args.tags, geometry=args.geometry)
+    datasets = make_datasets(meta, args.images, args.datasets, args.labels_per_image, obj_size=args.obj_size,
+                             tags_per_label=args.tags_per_label)
+    api = FakeApi(latency=args.latency, bandwidth=args.bandwidth)
+    src_project = api.add_project(WORKSPACE_ID, 'synthetic', meta.to_json(), datasets)
+    del datasets
+    generation_seconds = time.perf_counter() - t0
+
+    selected_tags = [t.name for t in meta.tag_metas][:args.selected_tags]
+    setup_app_env(src_project.id, selected_tags, args.handle_option, args.in_place, args.env)
+    rss_before_run = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    http_server = FakeHttpServer(api, fail_rate=args.fail_rate, lost_reply_rate=args.lost_reply_rate)
+    if args.async_io:
+        api.server_address = http_server.address
+        os.environ['ASYNC_IO'] = 'true'
+
+    import main as app    # reads settings from env on import
+    from run_report import run_report
+
+    with http_server:
+        t0 = time.perf_counter()
+        app.tags_to_classes(api, src_project.id, selected_tags, 'synthetic converted')
+        total_seconds = time.perf_counter() - t0
+
+    res_project_id = src_project.id if args.in_place else max(api.storage.projects)
+    res_images = sum(len(api.storage.dataset_images[ds.id]) for ds in api.storage.datasets.values()
+                     if ds.project_id == res_project_id)
+    if res_images != args.images:
+        raise RuntimeError(f'Result project has {res_images} images instead of {args.images}')
+
+    report = {
+        'params': {k: v for k, v in vars(args).items() if k != 'json'},
+        'generation_seconds': generation_seconds,
+        'total_seconds': total_seconds,
+        'images_per_second': args.images / total_seconds,
+        **run_report.to_json(),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_rss_before_run_mb': rss_before_run,
+        'requests': dict(api.network.requests),
+        'bytes_sent': api.network.bytes_sent,
+        'bytes_received': api.network.bytes_received,
+        'http_failed_requests': http_server.failed_requests,
+        'http_lost_replies': http_server.lost_replies,
+    }
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
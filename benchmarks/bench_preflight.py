@@ -0,0 +1,82 @@
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+
+from synthetic import GEOMETRY_TYPES, make_meta, make_datasets
+from fake_api import FakeApi
+from bench_pipeline import WORKSPACE_ID, setup_app_env
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Preflight estimates from a sample compared to the full project')
+    parser.add_argument('--images', type=int, default=5000)
+    parser.add_argument('--datasets', type=int, default=4)
+    parser.add_argument('--labels-per-image', type=int, default=10)
+    parser.add_argument('--tags', type=int, default=10)
+    parser.add_argument('--selected-tags', type=int, default=5)
+    parser.add_argument('--tags-per-label', type=float, default=1.0)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES), default='polygon')
+    parser.add_argument('--sample-fraction', type=float, default=0.05)
+    parser.add_argument('--min-sample-images', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per request')
+    parser.add_argument('--bandwidth', type=float, default=50e6, help='bytes per second')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app settings')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    meta = make_meta(args.tags, geometry=args.geometry)
+    datasets = make_datasets(meta, args.images, args.datasets, args.labels_per_image,
+                             tags_per_label=args.tags_per_label)
+    api = FakeApi(latency=args.latency, bandwidth=args.bandwidth)
+    src_project = api.add_project(WORKSPACE_ID, 'synthetic', meta.to_json(), datasets)
+    selected_tags = [t.name for t in meta.tag_metas][:args.selected_tags]
+    setup_app_env(src_project.id, selected_tags, 'create', False, args.env)
+
+    import main as app
+    from preflight import run_preflight, get_image_values
+
+    projects_cnt = len(api.storage.projects)
+    t0 = time.perf_counter()
+    report = run_preflight(api, src_project.id, selected_tags, args.sample_fraction, args.min_sample_images)
+    preflight_seconds = time.perf_counter() - t0
+    if len(api.storage.projects) != projects_cnt:
+        raise RuntimeError('Preflight has created a project')
+
+    # true totals from all annotations
+    truth = defaultdict(float)
+    for ann_jsons in datasets.values():
+        for ann_json in ann_jsons:
+            for name, value in get_image_values(ann_json, sorted(selected_tags)).items():
+                truth[name] += value
+    estimates = {name: report[name] for name in ('ann_bytes', 'objects', 'objects_covered', 'objects_intersected',
+                                                 'images_intersected')}
+    for tag_name, tag_report in report['tags'].items():
+        estimates[f'objects.{tag_name}'] = tag_report['objects']
+        estimates[f'images.{tag_name}'] = tag_report['images']
+    comparison = {name: {**est, 'true': truth[name], 'within_bounds': est['lower'] <= truth[name] <= est['upper']}
+                  for name, est in estimates.items()}
+
+    conversion_seconds = None
+    if not report['errors']:
+        t0 = time.perf_counter()
+        app.tags_to_classes(api, src_project.id, selected_tags, 'synthetic converted')
+        conversion_seconds = time.perf_counter() - t0
+
+    print(json.dumps({
+        'preflight_seconds': preflight_seconds,
+        'conversion_seconds': conversion_seconds,
+        'expected_seconds': report['expected_seconds'],
+        'sampled_images_cnt': report['sampled_images_cnt'],
+        'errors': report['errors'],
+        'warnings': report['warnings'],
+        'within_bounds_share': sum(c['within_bounds'] for c in comparison.values()) / len(comparison),
+        'estimates': comparison,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from bench_pipeline import setup_app_env
+
+
+# runs in a fresh interpreter: import of supervisely, app settings and web app (globals), app modules (main)
+CHILD_CODE = '''
+import json, time
+t0 = time.perf_counter()
+import supervisely
+t1 = time.perf_counter()
+import globals as g
+t2 = time.perf_counter()
+import main
+t3 = time.perf_counter()
+g.api
+t4 = time.perf_counter()
+print(json.dumps({'import_supervisely': t1 - t0, 'init_globals': t2 - t1, 'import_app_modules': t3 - t2,
+                  'api_client': t4 - t3, 'in_process_total': t4 - t0}))
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='App startup time: imports and initialization, eager and lazy')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--top-imports', type=int, default=0, help='also list the slowest imports of main')
+    return parser.parse_args()
+
+
+def measure(lazy: bool) -> dict:
+    env = {**os.environ, 'LAZY_STARTUP': str(lazy).lower()}
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', CHILD_CODE], check=True, capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - t0
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    res['interpreter'] = wall - res['in_process_total']
+    res['wall_total'] = wall
+    return res
+
+
+def top_imports(count: int) -> list:
+    # cumulative import time in seconds from -X importtime
+    env = {**os.environ, 'LAZY_STARTUP': 'true'}
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], check=True, capture_output=True,
+                         text=True, env=env).stderr
+    rows = []
+    for line in out.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative_us, name = line.split('|')
+            rows.append((name.strip(), int(cumulative_us) / 1e6))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:count]
+
+
+def main():
+    args = parse_args()
+    setup_app_env(1, ['tag_0'], 'create', False, [])
+    report = {}
+    for lazy in (False, True):
+        runs = [measure(lazy) for _ in range(args.repeats)]
+        report['lazy' if lazy else 'eager'] = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+    report['speedup'] = report['eager']['wall_total'] / report['lazy']['wall_total']
+    if args.top_imports:
+        report['top_imports'] = top_imports(args.top_imports)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
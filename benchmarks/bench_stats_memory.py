@@ -0,0 +1,64 @@
+import sys
+import json
+import resource
+import argparse
+import subprocess
+
+import numpy as np
+
+
+def ru_maxrss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024    # kilobytes on linux
+
+
+def run_single(objects_cnt: int, tags_cnt: int, tags_per_label: float) -> dict:
+    from synthetic import make_meta
+    from tags_stats import TagsStatsConstructor
+
+    meta = make_meta(tags_cnt, geometry='rectangle')
+    class_names = [c.name for c in meta.obj_classes]
+    tag_names = [t.name for t in meta.tag_metas]
+    rng = np.random.default_rng(0)
+    rss_before = ru_maxrss_mb()
+
+    # geometry-less jsons are enough, the stats pass never reads geometries
+    constructor = TagsStatsConstructor(meta)
+    labels_per_image = 100
+    for start in range(0, objects_cnt, labels_per_image):
+        objects = []
+        for _ in range(min(labels_per_image, objects_cnt - start)):
+            tags_cnt_obj = min(int(rng.poisson(tags_per_label)), tags_cnt)
+            obj_tags = rng.choice(tags_cnt, size=tags_cnt_obj, replace=False)
+            objects.append({'classTitle': class_names[rng.integers(len(class_names))],
+                            'tags': [{'name': tag_names[i]} for i in obj_tags]})
+        constructor.update_with_annotation_json({'tags': [], 'objects': objects})
+
+    stats = constructor.get_stats()
+    stats.objects_covered_cnt(tag_names)
+    return {'objects': objects_cnt, 'peak_rss_mb': ru_maxrss_mb(), 'stats_rss_mb': ru_maxrss_mb() - rss_before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak RSS of the stats pass against objects count')
+    parser.add_argument('--objects', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6, 5 * 10 ** 6])
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--tags-per-label', type=float, default=1.5)
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.objects[0], args.tags, args.tags_per_label)))
+        return
+
+    # every size runs in a fresh process, otherwise ru_maxrss would only grow
+    print(f'{"objects":>10} {"peak RSS, MB":>14} {"stats pass, MB":>16}')
+    for objects_cnt in args.objects:
+        out = subprocess.run([sys.executable, __file__, '--single', '--objects', str(objects_cnt),
+                              '--tags', str(args.tags), '--tags-per-label', str(args.tags_per_label)],
+                             check=True, capture_output=True, text=True).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        print(f'{res["objects"]:>10} {res["peak_rss_mb"]:>14.1f} {res["stats_rss_mb"]:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
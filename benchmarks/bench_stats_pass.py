@@ -0,0 +1,43 @@
+import time
+import argparse
+
+import supervisely as sly
+
+from synthetic import make_meta, make_ann_jsons
+from tags_stats import TagsStatsConstructor
+
+
+def bench(name: str, func, ann_jsons) -> float:
+    t0 = time.perf_counter()
+    for ann_json in ann_jsons:
+        func(ann_json)
+    elapsed = time.perf_counter() - t0
+    print(f'{name:<28} {elapsed:8.3f} s  {len(ann_jsons) / elapsed:10.1f} anns/s')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stats pass: sly.Annotation objects vs raw annotation jsons')
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--labels-per-image', type=int, default=20)
+    parser.add_argument('--mask-size', type=int, default=256)
+    parser.add_argument('--tags', type=int, default=10)
+    args = parser.parse_args()
+
+    meta = make_meta(args.tags, geometry='bitmap')
+    ann_jsons = make_ann_jsons(meta, args.images, args.labels_per_image, obj_size=args.mask_size)
+
+    constructor_obj = TagsStatsConstructor(meta)
+    t_obj = bench('from_json + update', lambda j: constructor_obj.update_with_annotation(
+        sly.Annotation.from_json(j, meta)), ann_jsons)
+
+    constructor_json = TagsStatsConstructor(meta)
+    t_json = bench('update_with_annotation_json', constructor_json.update_with_annotation_json, ann_jsons)
+
+    stats_obj, stats_json = constructor_obj.get_stats(), constructor_json.get_stats()
+    assert stats_obj.objects_count == stats_json.objects_count
+    print(f'speedup: {t_obj / t_json:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import json
+import time
+import threading
+import itertools
+from collections import namedtuple, defaultdict
+from typing import List
+
+ProjectInfo = namedtuple('ProjectInfo', ['id', 'name', 'workspace_id', 'items_count', 'updated_at', 'type'],
+                         defaults=['images'])
+DatasetInfo = namedtuple('DatasetInfo', ['id', 'name', 'project_id', 'items_count', 'updated_at'])
+ImageInfo = namedtuple('ImageInfo', ['id', 'name', 'hash', 'dataset_id'])
+AnnotationInfo = namedtuple('AnnotationInfo', ['image_id', 'image_name', 'annotation'])
+
+
+class FakeNetwork:
+    # every request costs latency plus its payload transferred with the given bandwidth
+    def __init__(self, latency: float = 0.0, bandwidth: float = float('inf')):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = defaultdict(int)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def request(self, name: str, bytes_sent: int = 0, bytes_received: int = 0):
+        with self._lock:
+            self.requests[name] += 1
+            self.bytes_sent += bytes_sent
+            self.bytes_received += bytes_received
+        delay = self.latency + (bytes_sent + bytes_received) / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _FakeStorage:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.projects = {}          # id -> ProjectInfo
+        self.project_metas = {}     # id -> meta json
+        self.datasets = {}          # id -> DatasetInfo
+        self.images = {}            # id -> ImageInfo
+        self.dataset_images = defaultdict(list)
+        self.anns = {}              # image id -> serialized annotation json
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self.ids)
+
+    @staticmethod
+    def unique_name(name: str, taken) -> str:
+        res, idx = name, 0
+        while res in taken:
+            idx += 1
+            res = f'{name}_{idx:03d}'
+        return res
+
+
+class _ProjectApi:
+    def __init__(self, storage: _FakeStorage, net: FakeNetwork):
+        self._s, self._net = storage, net
+
+    def get_info_by_id(self, id: int):
+        self._net.request('project.get_info_by_id')
+        return self._s.projects.get(id)
+
+    def get_meta(self, id: int) -> dict:
+        meta_json = self._s.project_metas[id]
+        self._net.request('project.get_meta', bytes_received=len(json.dumps(meta_json)))
+        return meta_json
+
+    def update_meta(self, id: int, meta: dict):
+        self._net.request('project.update_meta', bytes_sent=len(json.dumps(meta)))
+        self._s.project_metas[id] = meta
+
+    def create(self, workspace_id: int, name: str, type=None, change_name_if_conflict: bool = False, **kwargs):
+        self._net.request('project.create')
+        with self._s.lock:
+            name = self._s.unique_name(name, {p.name for p in self._s.projects.values()})
+        info = ProjectInfo(self._s.next_id(), name, workspace_id, 0, time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self._s.projects[info.id] = info
+        self._s.project_metas[info.id] = {}
+        return info
+
+    def get_list(self, workspace_id: int) -> list:
+        self._net.request('project.get_list')
+        return [p for p in self._s.projects.values() if p.workspace_id == workspace_id]
+
+
+class _DatasetApi:
+    def __init__(self, storage: _FakeStorage, net: FakeNetwork):
+        self._s, self._net = storage, net
+
+    def get_list(self, project_id: int) -> List[DatasetInfo]:
+        self._net.request('dataset.get_list')
+        return [ds._replace(items_count=len(self._s.dataset_images[ds.id]))
+                for ds in self._s.datasets.values() if ds.project_id == project_id]
+
+    def get_info_by_id(self, id: int):
+        self._net.request('dataset.get_info_by_id')
+        ds = self._s.datasets.get(id)
+        return ds._replace(items_count=len(self._s.dataset_images[id])) if ds else None
+
+    def create(self, project_id: int, name: str, change_name_if_conflict: bool = False, **kwargs) -> DatasetInfo:
+        self._net.request('dataset.create')
+        with self._s.lock:
+            taken = {ds.name for ds in self._s.datasets.values() if ds.project_id == project_id}
+            name = self._s.unique_name(name, taken)
+        info = DatasetInfo(self._s.next_id(), name, project_id, 0, time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self._s.datasets[info.id] = info
+        return info
+
+
+class _ImageApi:
+    def __init__(self, storage: _FakeStorage, net: FakeNetwork):
+        self._s, self._net = storage, net
+
+    def get_list(self, dataset_id: int) -> List[ImageInfo]:
+        img_ids = list(self._s.dataset_images[dataset_id])
+        self._net.request('image.get_list', bytes_received=200 * len(img_ids))
+        return [self._s.images[i] for i in img_ids]
+
+    def _add_image(self, dataset_id: int, name: str, img_hash: str) -> ImageInfo:
+        info = ImageInfo(self._s.next_id(), name, img_hash, dataset_id)
+        with self._s.lock:
+            self._s.images[info.id] = info
+            self._s.dataset_images[dataset_id].append(info.id)
+        return info
+
+    def upload_ids(self, dataset_id: int, names: List[str], ids: List[int], **kwargs) -> List[ImageInfo]:
+        self._net.request('image.upload_ids', bytes_sent=100 * len(ids))
+        return [self._add_image(dataset_id, name, self._s.images[src_id].hash) for name, src_id in zip(names, ids)]
+
+    def remove_batch(self, ids: List[int], **kwargs):
+        self._net.request('image.remove_batch', bytes_sent=10 * len(ids))
+        with self._s.lock:
+            for img_id in ids:
+                info = self._s.images.pop(img_id)
+                self._s.dataset_images[info.dataset_id].remove(img_id)
+                self._s.anns.pop(img_id, None)
+
+
+class _AnnotationApi:
+    def __init__(self, storage: _FakeStorage, net: FakeNetwork):
+        self._s, self._net = storage, net
+
+    def download_batch(self, dataset_id: int, image_ids: List[int], **kwargs) -> List[AnnotationInfo]:
+        datas = [self._s.anns[img_id] for img_id in image_ids]
+        self._net.request('annotation.download_batch', bytes_received=sum(len(d) for d in datas))
+        return [AnnotationInfo(img_id, self._s.images[img_id].name, json.loads(data))
+                for img_id, data in zip(image_ids, datas)]
+
+    def upload_jsons(self, img_ids: List[int], ann_jsons: List[dict], **kwargs):
+        datas = [json.dumps(ann_json).encode('utf-8') for ann_json in ann_jsons]
+        self._net.request('annotation.upload_jsons', bytes_sent=sum(len(d) for d in datas))
+        for img_id, data in zip(img_ids, datas):
+            self._s.anns[img_id] = data
+
+    def upload_anns(self, img_ids: List[int], anns, **kwargs):
+        self.upload_jsons(img_ids, [ann.to_json() for ann in anns])
+
+    def copy_batch_by_ids(self, src_image_ids: List[int], dst_image_ids: List[int], **kwargs):
+        # server-side copy, payload is ids only
+        self._net.request('annotation.copy_batch_by_ids', bytes_sent=20 * len(src_image_ids))
+        for src_id, dst_id in zip(src_image_ids, dst_image_ids):
+            self._s.anns[dst_id] = self._s.anns[src_id]
+
+
+class FakeApi:
+    # In-process stand-in for the part of sly.Api used by this app
+    def __init__(self, latency: float = 0.0, bandwidth: float = float('inf')):
+        self.server_address = None    # set when the storage is also served by FakeHttpServer
+        self.token = 'x' * 128
+        self.network = FakeNetwork(latency, bandwidth)
+        self.storage = _FakeStorage()
+        self.project = _ProjectApi(self.storage, self.network)
+        self.dataset = _DatasetApi(self.storage, self.network)
+        self.image = _ImageApi(self.storage, self.network)
+        self.annotation = _AnnotationApi(self.storage, self.network)
+
+    def add_project(self, workspace_id: int, name: str, meta_json: dict, datasets: dict) -> ProjectInfo:
+        # datasets: {dataset name: list of annotation jsons}, one image per annotation
+        s = self.storage
+        project = ProjectInfo(s.next_id(), name, workspace_id, 0, time.strftime('%Y-%m-%dT%H:%M:%S'))
+        s.projects[project.id] = project
+        s.project_metas[project.id] = meta_json
+        for ds_name, ann_jsons in datasets.items():
+            ds = DatasetInfo(s.next_id(), ds_name, project.id, 0, project.updated_at)
+            s.datasets[ds.id] = ds
+            for idx, ann_json in enumerate(ann_jsons):
+                img = ImageInfo(s.next_id(), f'img_{idx:06d}.jpg', f'hash_{ds.id}_{idx}', ds.id)
+                s.images[img.id] = img
+                s.dataset_images[ds.id].append(img.id)
+                s.anns[img.id] = json.dumps(ann_json).encode('utf-8')
+        return project
@@ -0,0 +1,123 @@
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_api import FakeApi
+
+
+API_PREFIX = '/public/api/v3/'
+EMPTY_ANN_JSON = {'description': '', 'tags': [], 'objects': []}    # of an image without annotation
+
+
+class FakeHttpServer:
+    # Local HTTP server for the bulk endpoints used by AsyncApiClient, backed by the storage of a FakeApi.
+    # Requests cost latency and bandwidth of the FakeApi network. fail_rate of them are answered with 503 and not
+    # processed; lost_reply_rate of them are processed, but answered with 504 as if a gateway has timed out.
+    def __init__(self, api: FakeApi, fail_rate: float = 0.0, lost_reply_rate: float = 0.0, seed: int = 0):
+        self._api = api
+        self._fail_rate = fail_rate
+        self._lost_reply_rate = lost_reply_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.failed_requests = 0
+        self.lost_replies = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-http-server', daemon=True)
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _should_fail(self) -> bool:
+        with self._rng_lock:
+            fail = self._rng.random() < self._fail_rate
+            self.failed_requests += fail
+        return fail
+
+    def _should_lose_reply(self) -> bool:
+        with self._rng_lock:
+            lose = self._rng.random() < self._lost_reply_rate
+            self.lost_replies += lose
+        return lose
+
+    def _bulk_info(self, data: dict) -> list:
+        s = self._api.storage
+        return [{'imageId': img_id, 'imageName': s.images[img_id].name, 'datasetId': data['datasetId'],
+                 'annotation': json.loads(s.anns[img_id]) if img_id in s.anns else EMPTY_ANN_JSON}
+                for img_id in data['imageIds']]
+
+    def _images_bulk_add(self, data: dict) -> list:
+        s = self._api.storage
+        infos = [self._api.image._add_image(data['datasetId'], item['title'], s.images[item['imageId']].hash)
+                 for item in data['images']]
+        return [{'id': info.id, 'name': info.name, 'datasetId': info.dataset_id} for info in infos]
+
+    def _annotations_bulk_add(self, data: dict) -> dict:
+        for item in data['annotations']:
+            self._api.storage.anns[item['imageId']] = json.dumps(item['annotation']).encode('utf-8')
+        return {'success': True}
+
+    def _images_list(self, data: dict) -> dict:
+        s = self._api.storage
+        infos = [s.images[img_id] for img_id in s.dataset_images[data['datasetId']]]
+        for flt in data.get('filter', []):
+            if flt['field'] != 'name' or flt['operator'] != 'in':
+                raise ValueError(f'Unsupported filter {flt!r}')
+            infos = [info for info in infos if info.name in flt['value']]
+        entities = [{'id': info.id, 'name': info.name, 'datasetId': info.dataset_id} for info in infos]
+        return {'total': len(entities), 'pagesCount': 1, 'entities': entities[:data.get('per_page', len(entities))]}
+
+    def _image_info(self, data: dict) -> dict:
+        info = self._api.storage.images[data['id']]
+        return {'id': info.id, 'name': info.name, 'datasetId': info.dataset_id}
+
+    def _make_handler(self):
+        server = self
+        methods = {
+            'annotations.bulk.info': self._bulk_info,
+            'images.bulk.add': self._images_bulk_add,
+            'annotations.bulk.add': self._annotations_bulk_add,
+            'images.list': self._images_list,
+            'images.info': self._image_info,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'    # keep-alive, so pooled connections are reused
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                method = self.path[len(API_PREFIX):] if self.path.startswith(API_PREFIX) else None
+                if method not in methods:
+                    return self._reply(404, {'error': f'Unknown method {self.path!r}'})
+                if server._should_fail():
+                    return self._reply(503, {'error': 'Service unavailable'})
+                res = json.dumps(methods[method](json.loads(body))).encode('utf-8')
+                server._api.network.request(f'http.{method}', bytes_sent=len(body), bytes_received=len(res))
+                if server._should_lose_reply():
+                    return self._reply(504, {'error': 'Gateway timeout'})
+                self._reply(200, raw=res)
+
+            def _reply(self, status: int, data=None, raw: bytes = None):
+                raw = raw if raw is not None else json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,73 @@
+import os
+import sys
+from typing import Dict, Iterator, List
+
+import numpy as np
+import supervisely as sly
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+
+GEOMETRY_TYPES = {
+    'bitmap': sly.Bitmap,
+    'polygon': sly.Polygon,
+    'rectangle': sly.Rectangle,
+    'point': sly.Point,
+}
+
+
+def make_meta(tags_cnt: int, geometry: str = 'bitmap', classes_cnt: int = 2) -> sly.ProjectMeta:
+    geometry_type = GEOMETRY_TYPES[geometry]
+    classes = [sly.ObjClass(f'{geometry}_{i}', geometry_type) for i in range(classes_cnt)]
+    tag_metas = [sly.TagMeta(f'tag_{i}', sly.TagValueType.NONE) for i in range(tags_cnt)]
+    return sly.ProjectMeta(obj_classes=sly.ObjClassCollection(classes), tag_metas=sly.TagMetaCollection(tag_metas))
+
+
+def _make_geometry(rng, geometry_type, img_size, obj_size: int):
+    row, col = (int(x) for x in rng.integers(0, min(img_size) - obj_size, size=2))
+    if geometry_type is sly.Bitmap:
+        mask = rng.random((obj_size, obj_size)) > 0.5
+        mask[0, 0] = True
+        return sly.Bitmap(mask, origin=sly.PointLocation(row, col))
+    if geometry_type is sly.Polygon:
+        angles = np.sort(rng.random(obj_size // 4 + 3)) * 2 * np.pi
+        half = obj_size / 2
+        exterior = [sly.PointLocation(int(row + half + half * np.sin(a)), int(col + half + half * np.cos(a)))
+                    for a in angles]
+        return sly.Polygon(exterior)
+    if geometry_type is sly.Rectangle:
+        return sly.Rectangle(row, col, row + obj_size, col + obj_size)
+    return sly.Point(row, col)
+
+
+def make_ann_jsons(meta: sly.ProjectMeta, images_cnt: int, labels_per_image: int, obj_size: int = 64,
+                   tags_per_label: float = 1.0, seed: int = 0) -> List[dict]:
+    # tags_per_label is the mean number of tags on a label (Poisson distributed, at most all tag metas)
+    return list(iterate_ann_jsons(meta, images_cnt, labels_per_image, obj_size, tags_per_label, seed))
+
+
+def make_datasets(meta: sly.ProjectMeta, images_cnt: int, datasets_cnt: int, labels_per_image: int,
+                  obj_size: int = 64, tags_per_label: float = 1.0, seed: int = 0) -> Dict[str, List[dict]]:
+    ann_jsons = iterate_ann_jsons(meta, images_cnt, labels_per_image, obj_size, tags_per_label, seed)
+    res = {f'ds_{i}': [] for i in range(datasets_cnt)}
+    for idx, ann_json in enumerate(ann_jsons):
+        res[f'ds_{idx % datasets_cnt}'].append(ann_json)
+    return res
+
+
+def iterate_ann_jsons(meta: sly.ProjectMeta, images_cnt: int, labels_per_image: int, obj_size: int,
+                      tags_per_label: float, seed: int) -> Iterator[dict]:
+    rng = np.random.default_rng(seed)
+    img_size = (obj_size * 4, obj_size * 4)
+    classes = list(meta.obj_classes)
+    tag_metas = list(meta.tag_metas)
+    for _ in range(images_cnt):
+        labels = []
+        for _ in range(labels_per_image):
+            obj_class = classes[rng.integers(len(classes))]
+            geom = _make_geometry(rng, obj_class.geometry_type, img_size, obj_size)
+            tags_cnt = min(int(rng.poisson(tags_per_label)), len(tag_metas))
+            label_tag_metas = rng.choice(len(tag_metas), size=tags_cnt, replace=False)
+            tags = sly.TagCollection([sly.Tag(tag_metas[i]) for i in label_tag_metas])
+            labels.append(sly.Label(geom, obj_class, tags=tags))
+        yield sly.Annotation(img_size, labels=labels).to_json()
@@ -0,0 +1,152 @@
+import copy
+import threading
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Set, Tuple, Optional
+
+import supervisely as sly
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.annotation.tag import TagJsonFields
+from supervisely.geometry.constants import ID
+
+
+# Server fields of the source project. Classes and tag metas are resolved by name on upload, ids would point
+# to the source project. Same fields are absent in the output of sly.Annotation.to_json().
+LABEL_SERVER_FIELDS = frozenset([ID, LabelJsonFields.OBJ_CLASS_ID, 'nnCreated', 'nnUpdated'])
+TAG_SERVER_FIELDS = frozenset([TagJsonFields.ID, 'tagId'])
+
+
+class LabelRewrite(NamedTuple):
+    # what to do with a label carrying some selected tags
+    tags_to_apply: Tuple[str, ...]    # removed from new labels, other tags remain
+    new_classes: Tuple[sly.ObjClass, ...]
+    multiple_tags: bool
+
+
+class AnnConvertor:
+    def __init__(self, appropriate_tags: List[str], src_meta: sly.ProjectMeta, res_meta: sly.ProjectMeta,
+                 handle_option: Optional[str] = None, memo_size: int = 4096):
+        self.tags_to_convert = set(appropriate_tags)
+        self.src_meta = src_meta
+        self.res_meta = res_meta
+        self.ignore_multiple_tags = handle_option == 'ignore'
+        self._tags_without_value = set(t.name for t in src_meta.tag_metas if t.value_type == sly.TagValueType.NONE)
+        self._classes_without_id = {}
+
+        self._local = threading.local()    # convert() may be called from several pipeline workers
+        # labels repeat few combinations of selected tags, so rewrites are memoized by the selected tags
+        # of a label (in label order)
+        self._label_rewrite = lru_cache(maxsize=memo_size)(self._create_label_rewrite)
+
+    @property
+    def multiple_tags_converted(self) -> bool:
+        return getattr(self._local, 'multiple_tags_converted', False)
+
+    @property
+    def labels_converted(self) -> bool:
+        # whether the last converted annotation differs from the source one
+        return getattr(self._local, 'labels_converted', False)
+
+    @property
+    def memo_counters(self) -> Dict[str, int]:
+        info = self._label_rewrite.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+
+    def convert(self, ann: sly.Annotation):
+        self._local.multiple_tags_converted = False
+        self._local.labels_converted = False
+        res_labels = self._convert_labels(ann.labels)
+        res_img_tags = self._convert_tags(ann.img_tags, tags_to_rm=set())
+        return ann.clone(labels=res_labels, img_tags=res_img_tags)
+
+    def convert_json(self, ann_json: dict) -> dict:
+        # same result as convert(), but geometries are passed through as is
+        self._local.multiple_tags_converted = False
+        self._local.labels_converted = False
+        res_objects = [new_obj for obj in ann_json.get(AnnotationJsonFields.LABELS, [])
+                       for new_obj in self._convert_label_json(obj)]
+        res_img_tags = [self._convert_tag_json(t) for t in ann_json.get(AnnotationJsonFields.IMG_TAGS, [])]
+        return {**ann_json, AnnotationJsonFields.LABELS: res_objects, AnnotationJsonFields.IMG_TAGS: res_img_tags}
+
+    def _create_label_rewrite(self, important_tags: Tuple[str, ...]) -> LabelRewrite:
+        multiple_tags = len(important_tags) > 1
+        if self.ignore_multiple_tags:
+            important_tags = important_tags[:1]    # first tag of the label
+        new_classes = tuple(self.res_meta.obj_classes.get(tag_name) for tag_name in important_tags)
+        return LabelRewrite(important_tags, new_classes, multiple_tags)
+
+    def _apply_label_rewrite(self, label_tag_names) -> LabelRewrite:
+        important_tags = tuple(dict.fromkeys(t for t in label_tag_names if t in self.tags_to_convert))
+        rewrite = self._label_rewrite(important_tags)
+        if rewrite.tags_to_apply:
+            self._local.labels_converted = True
+        if rewrite.multiple_tags:
+            self._local.multiple_tags_converted = True
+        return rewrite
+
+    def _convert_tags(self, tags: sly.TagCollection, tags_to_rm: Set[str]):
+        return sly.TagCollection([self._convert_tag(t) for t in tags if t.name not in tags_to_rm])
+
+    def _convert_tag(self, tag: sly.Tag):
+        new_tag_meta = self.res_meta.tag_metas.get(tag.name)
+        return tag.clone(meta=new_tag_meta)
+
+    def _convert_labels(self, labels: List[sly.Label]):
+        return [new_label for lbl in labels for new_label in self._convert_label(lbl)]
+
+    def _class_without_id(self, obj_class: sly.ObjClass) -> sly.ObjClass:
+        if obj_class.sly_id is None:
+            return obj_class
+        res = self._classes_without_id.get(obj_class.name)
+        if res is None:
+            res = self._classes_without_id[obj_class.name] = sly.ObjClass(
+                obj_class.name, obj_class.geometry_type, color=obj_class.color,
+                geometry_config=obj_class.geometry_config, hotkey=obj_class.hotkey)
+        return res
+
+    @staticmethod
+    def _geometry_without_ids(geometry):
+        if geometry.sly_id is None and geometry.class_id is None:
+            return geometry
+        res = copy.copy(geometry)    # shallow: geometries are never changed after creation
+        res.sly_id, res.class_id = None, None
+        return res
+
+    def _convert_label(self, label: sly.Label):
+        rewrite = self._apply_label_rewrite(t.name for t in label.tags)
+        geometry = self._geometry_without_ids(label.geometry)
+        if not rewrite.tags_to_apply:
+            obj_class = self._class_without_id(label.obj_class)
+            if geometry is label.geometry and obj_class is label.obj_class:
+                yield label
+            else:
+                yield label.clone(geometry=geometry, obj_class=obj_class)
+            return
+
+        new_tags = self._convert_tags(label.tags, tags_to_rm=set(rewrite.tags_to_apply))
+        for new_cls in rewrite.new_classes:
+            yield label.clone(geometry=geometry, obj_class=self._class_without_id(new_cls), tags=new_tags)
+
+    def _convert_tag_json(self, tag_json: dict) -> dict:
+        # same fields as sly.Tag.to_json() gives: no server ids, no value for tags without values
+        if tag_json[TagJsonFields.TAG_NAME] in self._tags_without_value:
+            return {k: v for k, v in tag_json.items() if k not in TAG_SERVER_FIELDS and k != TagJsonFields.VALUE}
+        return {TagJsonFields.VALUE: None,
+                **{k: v for k, v in tag_json.items() if k not in TAG_SERVER_FIELDS}}
+
+    def _convert_label_json(self, obj_json: dict):
+        tag_jsons = obj_json.get(LabelJsonFields.TAGS, [])
+        rewrite = self._apply_label_rewrite(t[TagJsonFields.TAG_NAME] for t in tag_jsons)
+        res_obj = {k: v for k, v in obj_json.items() if k not in LABEL_SERVER_FIELDS}
+        if not rewrite.tags_to_apply:
+            res_obj[LabelJsonFields.TAGS] = [self._convert_tag_json(t) for t in tag_jsons]
+            yield res_obj
+            return
+
+        new_tag_jsons = [self._convert_tag_json(t) for t in tag_jsons
+                         if t[TagJsonFields.TAG_NAME] not in rewrite.tags_to_apply]
+        for tag_name in rewrite.tags_to_apply:
+            new_obj = dict(res_obj)
+            new_obj[LabelJsonFields.OBJ_CLASS_NAME] = tag_name
+            new_obj[LabelJsonFields.TAGS] = list(new_tag_jsons)
+            yield new_obj
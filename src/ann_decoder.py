@@ -0,0 +1,71 @@
+import time
+import multiprocessing
+from multiprocessing.reduction import ForkingPickler
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List
+
+import numpy as np
+import supervisely as sly
+
+from run_report import run_report
+
+
+_worker_meta = None
+
+
+def _rebuild_bitmap(packed_data: bytes, shape: tuple, state: dict) -> sly.Bitmap:
+    # the bitmap was validated in the worker, so its constructor is not called again
+    res = sly.Bitmap.__new__(sly.Bitmap)
+    res.__dict__.update(state)
+    res._data = np.unpackbits(np.frombuffer(packed_data, dtype=np.uint8),
+                              count=int(np.prod(shape))).reshape(shape).astype(bool)
+    return res
+
+
+def _reduce_bitmap(bitmap: sly.Bitmap):
+    # bool masks are sent packed, 8 times smaller
+    state = {k: v for k, v in bitmap.__dict__.items() if k != '_data'}
+    return _rebuild_bitmap, (np.packbits(bitmap._data).tobytes(), bitmap._data.shape, state)
+
+
+def register_reducers():
+    ForkingPickler.register(sly.Bitmap, _reduce_bitmap)
+
+
+def _init_worker(meta_json: dict):
+    global _worker_meta
+    _worker_meta = sly.ProjectMeta.from_json(meta_json)
+    register_reducers()
+
+
+def _decode_chunk(ann_jsons: List[dict]) -> List[sly.Annotation]:
+    return [sly.Annotation.from_json(ann_json, _worker_meta) for ann_json in ann_jsons]
+
+
+class AnnDecoderPool:
+    # Decodes annotation jsons in worker processes, chunk by chunk. Output order is the input order.
+    # The app process still unpickles every annotation it gets, so the pool only helps if several cores are
+    # available and decoding costs more than unpickling: bitmaps are, polygons with many points may be not.
+    # benchmarks/bench_decode.py reports both costs.
+    def __init__(self, project_meta: sly.ProjectMeta, processes: int, chunk_size: int = 16):
+        if processes < 1 or chunk_size < 1:
+            raise ValueError(f'Wrong decoder pool settings. {processes=} {chunk_size=}')
+        self.chunk_size = chunk_size
+        # other threads (pipeline, run report, memory watchdog, async api) may be running, so workers are not
+        # forked from the app process: a lock held by one of those threads would never be released in a worker
+        self._executor = ProcessPoolExecutor(max_workers=processes,
+                                             mp_context=multiprocessing.get_context('forkserver'),
+                                             initializer=_init_worker, initargs=(project_meta.to_json(),))
+        list(self._executor.map(_decode_chunk, [[]] * processes))
+
+    def decode(self, ann_jsons: Iterable[dict]) -> Iterator[sly.Annotation]:
+        ann_jsons = list(ann_jsons)
+        chunks = [ann_jsons[i:i + self.chunk_size] for i in range(0, len(ann_jsons), self.chunk_size)]
+        t0 = time.perf_counter()
+        for anns in self._executor.map(_decode_chunk, chunks):
+            run_report.observe('decode_chunk', time.perf_counter() - t0)
+            yield from anns
+            t0 = time.perf_counter()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
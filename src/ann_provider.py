@@ -1,31 +1,55 @@
 import os
-from typing import List, Iterator
-from collections import defaultdict
+import json
+import mmap
+import time
+import zlib
+import struct
+import threading
+from typing import Any, List, Iterator, Optional, Sequence, Tuple
+from collections import defaultdict, OrderedDict
 
 import supervisely as sly
-from supervisely.io.json import dump_json_file, load_json_file
+from supervisely.io.json import load_json_file
 
 from project_commons import ProjectCommons
+from batching import AdaptiveBatchSize
+from ann_decoder import AnnDecoderPool
+from pipeline import BatchPipeline, PipelineStage
+from run_report import run_report
+
+
+def serialize_ann_json(ann_json: dict) -> bytes:
+    return json.dumps(ann_json, separators=(',', ':')).encode('utf-8')
 
 
 class AnnMemCache:
+    # keeps raw jsons: they are never modified, so no copies are needed and decoding is done by the reader
     def __init__(self):
         self._ds_id_to_anns = defaultdict(dict)
 
-    def _store(self, dataset_id, img_ids, anns):
+    def _store(self, dataset_id, img_ids, ann_jsons):
         ds_anns = self._ds_id_to_anns[dataset_id]
-        for img_id, ann in zip(img_ids, anns):
-            ds_anns[img_id] = ann.clone()
+        for img_id, ann_json in zip(img_ids, ann_jsons):
+            ds_anns[img_id] = ann_json
 
-    def get_anns(self, dataset_id, img_ids, download_jsons_cb, unpack_ann_json_cb):
+    def get_ann_jsons(self, dataset_id, img_ids, download_jsons_cb):
         ds_anns = self._ds_id_to_anns[dataset_id]
         if not all(i in ds_anns for i in img_ids):
-            ann_jsons = download_jsons_cb()
-            anns = [unpack_ann_json_cb(ann_json) for ann_json in ann_jsons]
-            self._store(dataset_id, img_ids, anns)
+            ann_jsons, _ = download_jsons_cb(serialize=False)
+            self._store(dataset_id, img_ids, ann_jsons)
         else:
-            anns = [ds_anns[img_id].clone() for img_id in img_ids]
-        return anns
+            ann_jsons = [ds_anns[img_id] for img_id in img_ids]
+        return ann_jsons
+
+
+class AnnNoCache:
+    # for a single pass over annotations
+    def __init__(self):
+        self.counters = {}
+
+    def get_ann_jsons(self, dataset_id, img_ids, download_jsons_cb):
+        ann_jsons, _ = download_jsons_cb(serialize=False)
+        return ann_jsons
 
 
 class AnnDiskCache:
@@ -39,12 +63,12 @@ class AnnDiskCache:
     def _ann_path(ds_dir: str, img_id: int):
         return os.path.join(ds_dir, str(img_id) + '.json')
 
-    def _store(self, dataset_id, img_ids, ann_jsons):
+    def _store_serialized(self, dataset_id, img_ids, ann_bytes):
         ds_dir = self._ds_dir(dataset_id)
         sly.fs.mkdir(ds_dir)
-        for img_id, ann_json in zip(img_ids, ann_jsons):
-            fpath = self._ann_path(ds_dir, img_id)
-            dump_json_file(ann_json, fpath)
+        for img_id, data in zip(img_ids, ann_bytes):
+            with open(self._ann_path(ds_dir, img_id), 'wb') as f:
+                f.write(data)
 
     def _load(self, dataset_id, img_ids):
         ds_dir = self._ds_dir(dataset_id)
@@ -54,14 +78,13 @@ class AnnDiskCache:
     def _anns_are_stored(self, dataset_id, img_ids):
         raise NotImplementedError()
 
-    def get_anns(self, dataset_id, img_ids, download_jsons_cb, unpack_ann_json_cb):
+    def get_ann_jsons(self, dataset_id, img_ids, download_jsons_cb):
         if not self._anns_are_stored(dataset_id, img_ids):
-            ann_jsons = download_jsons_cb()
-            self._store(dataset_id, img_ids, ann_jsons)
+            ann_jsons, ann_bytes = download_jsons_cb(serialize=True)
+            self._store_serialized(dataset_id, img_ids, ann_bytes)
         else:
-            ann_jsons = self._load(dataset_id, img_ids)
-        anns = [unpack_ann_json_cb(ann_json) for ann_json in ann_jsons]
-        return anns
+            ann_jsons = list(self._load(dataset_id, img_ids))
+        return ann_jsons
 
 
 class AnnDiskCacheRemovable(AnnDiskCache):
@@ -70,8 +93,8 @@ class AnnDiskCacheRemovable(AnnDiskCache):
         self._ds_id_to_anns = defaultdict(set)
         sly.fs.mkdir(self._dir, remove_content_if_exists=True)
 
-    def _store(self, dataset_id, img_ids, ann_jsons):
-        super()._store(dataset_id, img_ids, ann_jsons)
+    def _store_serialized(self, dataset_id, img_ids, ann_bytes):
+        super()._store_serialized(dataset_id, img_ids, ann_bytes)
         self._ds_id_to_anns[dataset_id].update(img_ids)
 
     def _anns_are_stored(self, dataset_id, img_ids):
@@ -89,24 +112,222 @@ class AnnDiskCachePersistent(AnnDiskCache):     # convenient for debugging
         return all(os.path.exists(self._ann_path(ds_dir, img_id)) for img_id in img_ids)
 
 
+class AnnShardCache(AnnDiskCache):
+    # One append-only shard file per dataset instead of a file per image. Record: header (img_id, size) followed
+    # by zlib compressed json. Offsets of records are kept in memory, reads go through mmap.
+    _header = struct.Struct('<qI')
+
+    def __init__(self, cache_dir: str, compress_level: int = 1):
+        super().__init__(cache_dir)
+        self._dir = os.path.join(cache_dir, 'ann_shards')
+        self._compress_level = compress_level
+        self._index = defaultdict(dict)   # dataset_id -> {img_id: (offset, size)}
+        self._lock = threading.Lock()
+
+    def _shard_path(self, dataset_id: int):
+        return os.path.join(self._dir, f'{dataset_id}.shard')
+
+    def _store_serialized(self, dataset_id, img_ids, ann_bytes):
+        payloads = [zlib.compress(data, self._compress_level) for data in ann_bytes]
+        with self._lock:
+            ds_index = self._index[dataset_id]
+            with open(self._shard_path(dataset_id), 'ab') as f:
+                offset = f.tell()
+                for img_id, payload in zip(img_ids, payloads):
+                    f.write(self._header.pack(img_id, len(payload)))
+                    f.write(payload)
+                    offset += self._header.size
+                    ds_index[img_id] = (offset, len(payload))
+                    offset += len(payload)
+
+    def _load(self, dataset_id, img_ids):
+        ds_index = self._index[dataset_id]
+        locations = [ds_index[img_id] for img_id in img_ids]
+        with open(self._shard_path(dataset_id), 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ann_jsons = [json.loads(zlib.decompress(mm[offset:offset + size])) for offset, size in locations]
+        return ann_jsons
+
+    def _anns_are_stored(self, dataset_id, img_ids):
+        ds_index = self._index[dataset_id]
+        return all(i in ds_index for i in img_ids)
+
+
+class AnnShardCacheRemovable(AnnShardCache):
+    def __init__(self, cache_dir: str, compress_level: int = 1):
+        super().__init__(cache_dir, compress_level)
+        sly.fs.mkdir(self._dir, remove_content_if_exists=True)
+
+
+class AnnShardCachePersistent(AnnShardCache):
+    def __init__(self, cache_dir: str, compress_level: int = 1):
+        super().__init__(cache_dir, compress_level)
+        sly.fs.mkdir(self._dir, remove_content_if_exists=False)
+        for fname in os.listdir(self._dir):
+            name, ext = os.path.splitext(fname)
+            if ext == '.shard':
+                self._read_index(int(name))
+
+    def _read_index(self, dataset_id: int):
+        path = self._shard_path(dataset_id)
+        ds_index = self._index[dataset_id]
+        file_size = os.path.getsize(path)
+        offset = 0
+        with open(path, 'rb') as f:
+            while offset + self._header.size <= file_size:
+                img_id, size = self._header.unpack(f.read(self._header.size))
+                if offset + self._header.size + size > file_size:
+                    break
+                ds_index[img_id] = (offset + self._header.size, size)
+                offset += self._header.size + size
+                f.seek(offset)
+        if offset < file_size:
+            sly.logger.warn(f'Ann cache shard is truncated, incomplete record is dropped. {path=}')
+            os.truncate(path, offset)
+
+
+class AnnTieredCache:
+    # Memory tier with a byte budget on top of a disk cache. Jsons are kept serialized in memory, so the budget
+    # is checked against their real size; least recently used entries are spilled to the disk tier.
+    def __init__(self, disk_cache: AnnDiskCache, memory_budget_bytes: int):
+        self._disk = disk_cache
+        self._budget = memory_budget_bytes
+        self._mem = OrderedDict()    # (dataset_id, img_id) -> bytes
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'spilled_anns': 0,
+            'spilled_bytes': 0,
+            'memory_bytes_peak': 0,
+        }
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._mem_bytes
+
+    def set_memory_budget(self, memory_budget_bytes: int):
+        # a lower budget spills the least recently used entries to disk right away
+        with self._lock:
+            self._budget = memory_budget_bytes
+            self._spill()
+
+    def _spill(self):
+        to_disk = defaultdict(list)
+        while self._mem_bytes > self._budget and self._mem:
+            (dataset_id, img_id), data = self._mem.popitem(last=False)
+            self._mem_bytes -= len(data)
+            to_disk[dataset_id].append((img_id, data))
+            self.counters['spilled_anns'] += 1
+            self.counters['spilled_bytes'] += len(data)
+        for dataset_id, entries in to_disk.items():
+            img_ids, ann_bytes = zip(*entries)
+            self._disk._store_serialized(dataset_id, img_ids, ann_bytes)
+
+    def _store(self, dataset_id, img_ids, ann_bytes):
+        with self._lock:
+            for img_id, data in zip(img_ids, ann_bytes):
+                key = (dataset_id, img_id)
+                if key in self._mem:
+                    self._mem_bytes -= len(self._mem.pop(key))
+                self._mem[key] = data
+                self._mem_bytes += len(data)
+            self.counters['memory_bytes_peak'] = max(self.counters['memory_bytes_peak'], self._mem_bytes)
+            self._spill()
+
+    def get_ann_jsons(self, dataset_id, img_ids, download_jsons_cb):
+        with self._lock:
+            in_mem = {}
+            for img_id in img_ids:
+                data = self._mem.get((dataset_id, img_id))
+                if data is not None:
+                    self._mem.move_to_end((dataset_id, img_id))
+                    in_mem[img_id] = data
+            on_disk = [i for i in img_ids if i not in in_mem]
+            stored = not on_disk or self._disk._anns_are_stored(dataset_id, on_disk)
+            if stored:
+                self.counters['memory_hits'] += len(in_mem)
+                self.counters['disk_hits'] += len(on_disk)
+            else:
+                self.counters['misses'] += len(img_ids)
+
+        if not stored:
+            ann_jsons, ann_bytes = download_jsons_cb(serialize=True)
+            self._store(dataset_id, img_ids, ann_bytes)
+            return ann_jsons
+
+        loaded = {}
+        if on_disk:
+            with run_report.timed('cache.disk_load'):
+                loaded = dict(zip(on_disk, self._disk._load(dataset_id, on_disk)))
+        with run_report.timed('cache.memory_load'):
+            return [json.loads(in_mem[i]) if i in in_mem else loaded[i] for i in img_ids]
+
+
 class AnnProvider:
-    def __init__(self, api: sly.Api, project: ProjectCommons, ann_cache=None):
+    def __init__(self, api: sly.Api, project: ProjectCommons, ann_cache=None,
+                 download_batch_sizer: Optional[AdaptiveBatchSize] = None,
+                 ann_decoder: Optional[AnnDecoderPool] = None, download_prefetch: int = 1,
+                 count_payload_bytes: bool = False):
         self._api = api
         self._project = project
         self._cache = ann_cache if ann_cache else AnnMemCache()
+        self._batch_sizer = download_batch_sizer
+        self._decoder = ann_decoder
+        self._prefetch = download_prefetch    # batches downloaded concurrently by get_ann_json_batches
+        # payload is measured by the serialization a cache does anyway; caches keeping jsons as they are
+        # serialize them for the count only if it is asked for
+        self._count_payload_bytes = count_payload_bytes
 
-    def get_anns(self) -> Iterator[sly.Annotation]:
-        for ds_info, img_ids, _, _ in self._project.iterate_batched():
-            for ann in self.get_anns_by_img_ids(ds_info.id, img_ids):
-                yield ann
+    @property
+    def bytes_per_ann(self) -> Optional[float]:
+        # smoothed size of downloaded annotations, None until it is measured
+        return self._batch_sizer.bytes_per_item if self._batch_sizer is not None else None
 
-    def get_anns_by_img_ids(self, dataset_id: int, img_ids: List[int]) -> Iterator[sly.Annotation]:
-        def download_jsons():
-            return [ann_info.annotation for ann_info in self._api.annotation.download_batch(dataset_id, img_ids)]
+    def get_ann_json_batches(self, ds_infos) -> Iterator[Tuple[Any, Sequence[int], List[dict]]]:
+        # (ds_info, img_ids, ann_jsons) in dataset order; with prefetch the next batches are downloaded meanwhile,
+        # datasets are not waited for one by one
+        def download(batch):
+            ds_info, img_ids = batch
+            return ds_info, img_ids, list(self.get_ann_jsons_by_img_ids(ds_info.id, img_ids))
 
-        def unpack_ann_json(ann_json):
-            return sly.Annotation.from_json(ann_json, self._project.meta)
+        batches = ((ds_info, batch[1]) for ds_info in ds_infos
+                   for batch in self._project.iterate_dataset_batched(ds_info, batch_sizer=self._batch_sizer))
+        if self._prefetch <= 1:
+            yield from map(download, batches)
+            return
+        pipeline = BatchPipeline([PipelineStage('download', download, workers=self._prefetch)],
+                                 max_in_flight=self._prefetch)
+        yield from pipeline.run(batches)
 
-        res_anns = self._cache.get_anns(dataset_id, img_ids, download_jsons, unpack_ann_json)
-        for ann in res_anns:
+    def get_anns_by_img_ids(self, dataset_id: int, img_ids: List[int]) -> Iterator[sly.Annotation]:
+        if self._decoder is not None:
+            yield from self._decoder.decode(self.get_ann_jsons_by_img_ids(dataset_id, img_ids))
+            return
+        for ann_json in self.get_ann_jsons_by_img_ids(dataset_id, img_ids):
+            t0 = time.perf_counter()
+            ann = sly.Annotation.from_json(ann_json, self._project.meta)
+            run_report.observe('decode_annotation', time.perf_counter() - t0)
             yield ann
+
+    def get_ann_jsons_by_img_ids(self, dataset_id: int, img_ids: List[int]) -> Iterator[dict]:
+        def download_jsons(serialize: bool) -> Tuple[List[dict], Optional[List[bytes]]]:
+            t0 = time.perf_counter()
+            ann_jsons = [ann_info.annotation for ann_info in self._api.annotation.download_batch(dataset_id, img_ids)]
+            seconds = time.perf_counter() - t0
+            run_report.observe('api.download_batch', seconds)
+            run_report.count('anns_downloaded', len(ann_jsons))
+            ann_bytes, payload_bytes = None, None
+            if serialize or self._count_payload_bytes:
+                ann_bytes = [serialize_ann_json(ann_json) for ann_json in ann_jsons]
+                payload_bytes = sum(len(data) for data in ann_bytes)
+                run_report.count('bytes_downloaded', payload_bytes)
+            if self._batch_sizer is not None:
+                self._batch_sizer.record(len(img_ids), payload_bytes, seconds)
+            return ann_jsons, ann_bytes
+
+        res_ann_jsons = self._cache.get_ann_jsons(dataset_id, img_ids, download_jsons)
+        for ann_json in res_ann_jsons:
+            yield ann_json
@@ -0,0 +1,252 @@
+import random
+import asyncio
+import threading
+from collections import namedtuple
+from typing import Awaitable, Callable, List
+
+import supervisely as sly
+from supervisely.api.module_api import ApiField
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.annotation.tag import TagJsonFields
+
+from run_report import run_report
+
+
+AnnJsonInfo = namedtuple('AnnJsonInfo', ['image_id', 'image_name', 'annotation'])
+ImageIdInfo = namedtuple('ImageIdInfo', ['id', 'name'])
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+REJECTED_STATUS_CODES = {429}    # the server has not processed the request
+
+
+class UncertainWriteError(Exception):
+    # a write request has failed, and it is unknown whether the server has applied it
+    pass
+
+
+def get_ann_signature(ann_json: dict) -> tuple:
+    # enough to tell an uploaded annotation from the one it replaces, server ids and field order aside
+    def tag_names(tag_jsons):
+        return tuple(sorted(t[TagJsonFields.TAG_NAME] for t in tag_jsons))
+
+    objects = sorted((obj[LabelJsonFields.OBJ_CLASS_NAME], tag_names(obj.get(LabelJsonFields.TAGS, [])))
+                     for obj in ann_json.get(AnnotationJsonFields.LABELS, []))
+    return tuple(objects), tag_names(ann_json.get(AnnotationJsonFields.IMG_TAGS, []))
+
+
+class AsyncApiClient:
+    # Bulk annotation and image requests over one pooled HTTP session. At most `concurrency` requests are sent
+    # at once; failed requests are retried with exponential backoff and jitter.
+    # Reads are retried on any transient failure (connection errors, 5xx, 429). Writes create new entities, so
+    # they are retried as is only if the server has surely not processed them; after other failures the server
+    # state is checked first and only what is missing is sent again. Chunks of a write are sent one after
+    # another, so images are added to a dataset in the order they are given.
+    def __init__(self, server_address: str, token: str, concurrency: int = 8, retries: int = 5,
+                 backoff_seconds: float = 0.5, max_backoff_seconds: float = 30.0, timeout_seconds: float = 120.0,
+                 request_batch_size: int = 50):
+        if concurrency < 1:
+            raise ValueError(f'Async api client needs at least one connection. {concurrency=}')
+        self._base_url = server_address.rstrip('/') + '/public/api/v3/'
+        self._token = token
+        self._concurrency = concurrency
+        self._retries = retries
+        self._backoff_seconds = backoff_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        self._timeout_seconds = timeout_seconds
+        self._request_batch_size = request_batch_size
+        self._session = None
+        self._semaphore = None
+        self._img_dataset_ids = {}    # image id -> dataset id, saves a lookup request per annotation upload
+
+    async def open(self):
+        import httpx    # optional dependency, needed by async I/O only
+
+        limits = httpx.Limits(max_connections=self._concurrency, max_keepalive_connections=self._concurrency)
+        self._session = httpx.AsyncClient(base_url=self._base_url, headers={'x-api-key': self._token},
+                                          limits=limits, timeout=self._timeout_seconds)
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.aclose()
+            self._session = None
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return min(self._max_backoff_seconds, self._backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def post(self, method: str, data: dict, idempotent: bool = True):
+        # a write (idempotent=False) is retried only if it has not reached the server, otherwise
+        # UncertainWriteError is raised
+        import httpx
+
+        for attempt in range(self._retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await self._session.post(method, json=data)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                error = f'status {response.status_code}'
+                if not idempotent and response.status_code not in REJECTED_STATUS_CODES:
+                    raise UncertainWriteError(error)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+                error = repr(exc)    # nothing is sent
+            except httpx.TransportError as exc:
+                if not idempotent:
+                    raise UncertainWriteError(repr(exc)) from exc
+                error = repr(exc)
+            if attempt == self._retries:
+                raise RuntimeError(f'Request failed after {attempt + 1} attempts. {method=} {error=}')
+            delay = self._backoff_delay(attempt)
+            sly.logger.debug(f'Request is retried. {method=} {error=} {attempt=} {delay=:.2f}')
+            run_report.count('async_api.retries')
+            await asyncio.sleep(delay)
+
+    async def post_write(self, method: str, items: list, make_data: Callable[[list], dict],
+                         get_applied: Callable[[list], Awaitable[dict]]) -> list:
+        # items of one request; get_applied(items) returns {item index: result} for items the server already has
+        results = {}
+        left = list(range(len(items)))
+        for attempt in range(self._retries + 1):
+            try:
+                res = await self.post(method, make_data([items[i] for i in left]), idempotent=False)
+                results.update(zip(left, res if isinstance(res, list) else [None] * len(left)))
+                return [results[i] for i in range(len(items))]
+            except UncertainWriteError as exc:
+                error = str(exc)
+            if attempt == self._retries:
+                break
+            applied = await get_applied([items[i] for i in left])
+            results.update((left[i], res) for i, res in applied.items())
+            left = [idx for i, idx in enumerate(left) if i not in applied]
+            sly.logger.debug(f'Write is reconciled. {method=} {error=} {attempt=} applied={len(applied)}')
+            run_report.count('async_api.write_reconciles')
+            if not left:
+                return [results[i] for i in range(len(items))]
+            await asyncio.sleep(self._backoff_delay(attempt))
+        raise RuntimeError(f'Request failed after {self._retries + 1} attempts. {method=} {error=}')
+
+    def _chunks(self, items: list) -> List[list]:
+        # the server takes bulk requests of limited size
+        return [items[i:i + self._request_batch_size] for i in range(0, len(items), self._request_batch_size)]
+
+    async def post_batched(self, method: str, items: list, make_data: Callable[[list], dict]) -> list:
+        # reads only: chunks are sent concurrently; responses are in chunk order
+        return await asyncio.gather(*(self.post(method, make_data(chunk)) for chunk in self._chunks(items)))
+
+    async def get_image_dataset_id(self, img_id: int) -> int:
+        if img_id not in self._img_dataset_ids:
+            res = await self.post('images.info', {ApiField.ID: img_id})
+            self._img_dataset_ids[img_id] = res[ApiField.DATASET_ID]
+        return self._img_dataset_ids[img_id]
+
+    async def download_ann_jsons(self, dataset_id: int, img_ids: List[int]) -> List[AnnJsonInfo]:
+        responses = await self.post_batched('annotations.bulk.info', list(img_ids), lambda chunk: {
+            ApiField.DATASET_ID: dataset_id,
+            ApiField.IMAGE_IDS: chunk,
+        })
+        by_id = {item[ApiField.IMAGE_ID]: item for res in responses for item in res}
+        self._img_dataset_ids.update((img_id, dataset_id) for img_id in img_ids)
+        return [AnnJsonInfo(img_id, by_id[img_id].get(ApiField.IMAGE_NAME), by_id[img_id][ApiField.ANNOTATION])
+                for img_id in img_ids]
+
+    async def _get_added_images(self, dataset_id: int, images: List[dict]) -> dict:
+        # image names are unique in a dataset
+        res = await self.post('images.list', {
+            ApiField.DATASET_ID: dataset_id,
+            ApiField.FILTER: [{ApiField.FIELD: ApiField.NAME, 'operator': 'in',
+                               'value': [img['title'] for img in images]}],
+            ApiField.PER_PAGE: len(images),
+        })
+        by_name = {item[ApiField.NAME]: item for item in res['entities']}
+        return {i: by_name[img['title']] for i, img in enumerate(images) if img['title'] in by_name}
+
+    async def upload_image_ids(self, dataset_id: int, names: List[str], ids: List[int]) -> List[ImageIdInfo]:
+        images = [{'title': name, ApiField.IMAGE_ID: img_id} for name, img_id in zip(names, ids)]
+        res_infos = []
+        for chunk in self._chunks(images):
+            res = await self.post_write('images.bulk.add', chunk, lambda items: {
+                ApiField.DATASET_ID: dataset_id,
+                ApiField.IMAGES: items,
+            }, lambda items: self._get_added_images(dataset_id, items))
+            res_infos.extend(ImageIdInfo(item[ApiField.ID], item[ApiField.NAME]) for item in res)
+        self._img_dataset_ids.update((info.id, dataset_id) for info in res_infos)
+        return res_infos
+
+    async def _get_added_anns(self, dataset_id: int, annotations: List[dict]) -> dict:
+        res = await self.post('annotations.bulk.info', {
+            ApiField.DATASET_ID: dataset_id,
+            ApiField.IMAGE_IDS: [item[ApiField.IMAGE_ID] for item in annotations],
+        })
+        server_signatures = {item[ApiField.IMAGE_ID]: get_ann_signature(item[ApiField.ANNOTATION]) for item in res}
+        return {i: None for i, item in enumerate(annotations)
+                if server_signatures.get(item[ApiField.IMAGE_ID]) == get_ann_signature(item[ApiField.ANNOTATION])}
+
+    async def upload_ann_jsons(self, img_ids: List[int], ann_jsons: List[dict]) -> None:
+        if not img_ids:
+            return
+        dataset_id = await self.get_image_dataset_id(img_ids[0])
+        annotations = [{ApiField.IMAGE_ID: img_id, ApiField.ANNOTATION: ann_json}
+                       for img_id, ann_json in zip(img_ids, ann_jsons)]
+        for chunk in self._chunks(annotations):
+            await self.post_write('annotations.bulk.add', chunk, lambda items: {
+                ApiField.DATASET_ID: dataset_id,
+                ApiField.ANNOTATIONS: items,
+            }, lambda items: self._get_added_anns(dataset_id, items))
+
+
+class _AsyncAnnotationApi:
+    def __init__(self, bridge: 'AsyncApiBridge'):
+        self._bridge = bridge
+
+    def download_batch(self, dataset_id: int, image_ids: List[int], **kwargs) -> List[AnnJsonInfo]:
+        return self._bridge.run(self._bridge.client.download_ann_jsons(dataset_id, image_ids))
+
+    def upload_jsons(self, img_ids: List[int], ann_jsons: List[dict], **kwargs):
+        self._bridge.run(self._bridge.client.upload_ann_jsons(img_ids, ann_jsons))
+
+    def __getattr__(self, name):
+        return getattr(self._bridge.api.annotation, name)
+
+
+class _AsyncImageApi:
+    def __init__(self, bridge: 'AsyncApiBridge'):
+        self._bridge = bridge
+
+    def upload_ids(self, dataset_id: int, names: List[str], ids: List[int], **kwargs) -> List[ImageIdInfo]:
+        return self._bridge.run(self._bridge.client.upload_image_ids(dataset_id, names, ids))
+
+    def __getattr__(self, name):
+        return getattr(self._bridge.api.image, name)
+
+
+class AsyncApiBridge:
+    # Stands in for sly.Api: bulk annotation and image calls go through AsyncApiClient on an event loop in
+    # a background thread, so calls from several worker threads share the session and its concurrency limit.
+    # Everything else is passed to the wrapped api.
+    def __init__(self, api: sly.Api, client: AsyncApiClient):
+        self.api = api
+        self.client = client
+        self.annotation = _AsyncAnnotationApi(self)
+        self.image = _AsyncImageApi(self)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='async-api', daemon=True)
+        self._thread.start()
+        self.run(self.client.open())
+
+    @classmethod
+    def from_api(cls, api: sly.Api, **client_kwargs) -> 'AsyncApiBridge':
+        return cls(api, AsyncApiClient(api.server_address, api.token, **client_kwargs))
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        self.run(self.client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
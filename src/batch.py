@@ -0,0 +1,104 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import supervisely as sly
+from supervisely.io.json import dump_json_file
+
+from main import create_async_api, convert_project
+from run_report import RunReport, use_run_report
+import globals as g
+
+
+def get_batch_project_ids(api: sly.Api, project_ids: List[int], workspace_id: int) -> List[int]:
+    if project_ids:
+        return project_ids
+    if not workspace_id:
+        raise ValueError('Batch mode needs BATCH_PROJECT_IDS or BATCH_WORKSPACE_ID')
+    project_infos = api.project.get_list(workspace_id)
+    return [p.id for p in project_infos if p.type == str(sly.ProjectType.IMAGES)]
+
+
+def convert_batch_project(api: sly.Api, project_id: int, selected_tags: List[str]) -> dict:
+    # every project has its own run report and working directories, a failure does not stop the batch
+    data_dir = os.path.join(g.data_directory, 'batch', str(project_id))
+    temp_dir = os.path.join(g.temp_data_directory, 'batch', str(project_id))
+    report = RunReport()
+    error = None
+    t0 = time.perf_counter()
+    with use_run_report(report):
+        try:
+            convert_project(api, project_id, selected_tags, None, data_dir, temp_dir)
+        except Exception as exc:
+            sly.logger.error(f'Project conversion failed. {project_id=}', exc_info=True)
+            error = repr(exc)
+    seconds = time.perf_counter() - t0
+    images_cnt = report.counters.get('images_processed', 0)
+    return {
+        'project_id': project_id,
+        'status': 'failed' if error else 'done',
+        'error': error,
+        'seconds': seconds,
+        'images_cnt': images_cnt,
+        'images_per_second': images_cnt / seconds if seconds > 0 else 0.0,
+        'run_report': report.to_json(),
+    }
+
+
+@sly.timeit
+def convert_batch(api: sly.Api, project_ids: List[int], selected_tags: List[str], projects_in_flight: int) -> dict:
+    # one api client, async session and stats cache serve all projects, at most projects_in_flight run at once
+    if projects_in_flight < 1:
+        raise ValueError(f'Batch mode needs at least one project in flight. {projects_in_flight=}')
+    async_api = create_async_api(api)
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=projects_in_flight, thread_name_prefix='batch') as executor:
+            results = list(executor.map(lambda pid: convert_batch_project(async_api or api, pid, selected_tags),
+                                        project_ids))
+    finally:
+        if async_api is not None:
+            async_api.close()
+    seconds = time.perf_counter() - t0
+
+    for res in results:
+        sly.logger.info('Batch project result', extra={k: v for k, v in res.items() if k != 'run_report'})
+    images_cnt = sum(res['images_cnt'] for res in results)
+    return {
+        'projects_cnt': len(results),
+        'failed_cnt': sum(res['status'] == 'failed' for res in results),
+        'seconds': seconds,
+        'images_cnt': images_cnt,
+        'images_per_second': images_cnt / seconds if seconds > 0 else 0.0,
+        'projects': results,
+    }
+
+
+if __name__ == '__main__':
+    batch_project_ids = get_batch_project_ids(g.api, g.batch_project_ids, g.batch_workspace_id)
+    sly.logger.info(
+        'Batch arguments',
+        extra={
+            'project_ids': batch_project_ids,
+            'projects_in_flight': g.batch_projects_in_flight,
+            'modal.state.selectedTags.tags': g.selected_tags,
+            'modal.state.handleMulti': str(g.handle_multiple_tags),
+            'modal.state.handleOption': g.handle_option,
+            'modal.state.inPlace': str(g.in_place),
+        },
+    )
+
+    batch_report = convert_batch(g.api, batch_project_ids, g.selected_tags, g.batch_projects_in_flight)
+    batch_report_path = os.path.join(g.data_directory, 'batch_report.json')
+    sly.fs.ensure_base_path(batch_report_path)
+    dump_json_file(batch_report, batch_report_path)
+    sly.logger.info(f'Batch report is saved: {batch_report_path!r}', extra={
+        k: v for k, v in batch_report.items() if k != 'projects'})
+    if batch_report['failed_cnt']:
+        raise RuntimeError(f'Conversion failed for {batch_report["failed_cnt"]} of {len(batch_project_ids)} projects')
+
+    try:
+        sly.app.fastapi.shutdown()
+    except KeyboardInterrupt:
+        sly.logger.info('Application shutdown successfully')
@@ -0,0 +1,73 @@
+import threading
+from typing import Optional
+
+import supervisely as sly
+
+
+class AdaptiveBatchSize:
+    # Batch size for one kind of request, tuned from observed payload and latency: the next batch should take
+    # about target_seconds and carry at most max_payload_bytes. Estimates are smoothed, growth is limited to x2.
+    def __init__(self, name: str, initial: int = 50, min_size: int = 1, max_size: int = 1000,
+                 target_seconds: float = 2.0, max_payload_bytes: int = 32 << 20, smoothing: float = 0.3):
+        if not 1 <= min_size <= max_size:
+            raise ValueError(f'Wrong batch size limits. {name=} {min_size=} {max_size=}')
+        self.name = name
+        self._min = min_size
+        self._max = max_size
+        self._target_seconds = target_seconds
+        self._max_payload_bytes = max_payload_bytes
+        self._smoothing = smoothing
+        self.size = self._clamp(initial)    # for the next batch
+        self._seconds_per_item = None
+        self._bytes_per_item = None
+        # recorded batches: count, items, min and max size
+        self._batches_cnt = 0
+        self._items_cnt = 0
+        self._min_used = None
+        self._max_used = None
+        self._lock = threading.Lock()
+
+    def _clamp(self, size) -> int:
+        return max(self._min, min(self._max, int(size)))
+
+    def _smooth(self, prev, value):
+        return value if prev is None else prev + self._smoothing * (value - prev)
+
+    @property
+    def bytes_per_item(self) -> Optional[float]:
+        return self._bytes_per_item
+
+    def record(self, items_cnt: int, payload_bytes: Optional[int], seconds: float):
+        # payload_bytes is None when it was not measured, the payload estimate is kept as is then
+        if items_cnt < 1:
+            return
+        with self._lock:
+            self._batches_cnt += 1
+            self._items_cnt += items_cnt
+            self._min_used = items_cnt if self._min_used is None else min(self._min_used, items_cnt)
+            self._max_used = items_cnt if self._max_used is None else max(self._max_used, items_cnt)
+            self._seconds_per_item = self._smooth(self._seconds_per_item, seconds / items_cnt)
+            if payload_bytes is not None:
+                self._bytes_per_item = self._smooth(self._bytes_per_item, payload_bytes / items_cnt)
+            by_time = self._target_seconds / max(self._seconds_per_item, 1e-6)
+            by_payload = (self._max_payload_bytes / max(self._bytes_per_item, 1.0)
+                          if self._bytes_per_item is not None else self._max)
+            new_size = self._clamp(min(by_time, by_payload, self.size * 2))
+            if new_size != self.size:
+                sly.logger.debug(f'Batch size changed: {self.name} {self.size} -> {new_size}', extra={
+                    'seconds_per_item': self._seconds_per_item,
+                    'bytes_per_item': self._bytes_per_item,
+                })
+                self.size = new_size
+
+    def summary(self) -> dict:
+        with self._lock:
+            if not self._batches_cnt:
+                return {'batches': 0}
+            return {
+                'batches': self._batches_cnt,
+                'min_size': self._min_used,
+                'max_size': self._max_used,
+                'mean_size': self._items_cnt / self._batches_cnt,
+                'last_size': self.size,
+            }
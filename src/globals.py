@@ -1,11 +1,11 @@
 import ast
 import os
 import sys
+import importlib.util
+import multiprocessing
 
 import supervisely as sly
 
-from fastapi import FastAPI
-from supervisely.app.fastapi import create
 from supervisely.app.content import get_data_dir
 from distutils.util import strtobool
 
@@ -17,15 +17,44 @@ data_directory = get_data_dir()
 temp_data_directory = os.getenv('DEBUG_TEMPORARY_APP_DIR', '/tmp/sly-app')  # to be removed after task execution
 sly.logger.info(f'App data directory: {data_directory!r}  Temporary data directory: {temp_data_directory!r}')
 
-app = FastAPI()
-sly_app = create()
-app.mount('/sly', sly_app)
-api = sly.Api.from_env()
+# The app is headless, the web app is not served. With lazy startup it is not created unless accessed,
+# as well as the api client, so short runs do not pay for them.
+lazy_startup = bool(strtobool(os.getenv('LAZY_STARTUP', 'false')))
+
+
+def _create_web_app():
+    from fastapi import FastAPI
+    from supervisely.app.fastapi import create
+
+    web_app = FastAPI()
+    sly_web_app = create()
+    web_app.mount('/sly', sly_web_app)
+    return web_app, sly_web_app
+
+
+def __getattr__(name: str):
+    # called only for attributes not created yet, i.e. with lazy startup
+    if name in ('app', 'sly_app'):
+        globals()['app'], globals()['sly_app'] = _create_web_app()
+    elif name == 'api':
+        globals()['api'] = sly.Api.from_env()
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return globals()[name]
+
+
+# Worker processes of the annotation decoder import the main module again while they start, and they need
+# neither the web app nor the api client. Such an import is marked by multiprocessing with _inheriting.
+_imported_by_worker = getattr(multiprocessing.current_process(), '_inheriting', False)
+
+if not lazy_startup and not _imported_by_worker:
+    app, sly_app = _create_web_app()
+    api = sly.Api.from_env()
 
 task_id = int(os.environ['TASK_ID'])
 team_id = int(os.environ['context.teamId'])
 workspace_id = int(os.environ['context.workspaceId'])
-project_id = int(os.environ['modal.state.slyProjectId'])
+project_id = int(os.environ['modal.state.slyProjectId']) if 'modal.state.slyProjectId' in os.environ else None
 
 selected_tags = os.environ['modal.state.selectedTags.tags']
 selected_tags = ast.literal_eval(selected_tags)
@@ -36,4 +65,53 @@ handle_multiple_tags = bool(strtobool(os.environ['modal.state.handleMulti']))
 handle_option = os.environ['modal.state.handleOption'] if handle_multiple_tags else None
 
 res_project_name = os.getenv('modal.state.resultProjectName', None)
-anns_in_memory_limit = os.getenv('ANNS_IN_MEMORY_LIMIT', 1000)
+in_place = bool(strtobool(os.getenv('modal.state.inPlace', 'false')))   # convert source project without copying
+ann_cache_memory_bytes = int(os.getenv('ANN_CACHE_MEMORY_BYTES', 1 << 30))   # spilled to disk above this size
+ann_disk_cache_type = os.getenv('ANN_DISK_CACHE_TYPE', 'shards')   # 'shards' or 'files'
+memory_watchdog_interval = float(os.getenv('MEMORY_WATCHDOG_INTERVAL', 1.0))   # seconds, 0 to disable
+memory_limit_bytes = int(os.getenv('MEMORY_LIMIT_BYTES', 0))   # 0 to take the container or physical memory size
+memory_soft_ratio = float(os.getenv('MEMORY_SOFT_RATIO', 0.7))   # of the limit, ann cache memory tier is cut
+memory_hard_ratio = float(os.getenv('MEMORY_HARD_RATIO', 0.85))   # of the limit, ann cache is moved to disk
+
+pipeline_max_in_flight = int(os.getenv('PIPELINE_MAX_IN_FLIGHT', 4))
+pipeline_convert_workers = int(os.getenv('PIPELINE_CONVERT_WORKERS', 2))
+pipeline_upload_workers = int(os.getenv('PIPELINE_UPLOAD_WORKERS', 2))
+# copy mode: annotations without converted labels are copied on server side instead of uploaded. The copy
+# relies on the result meta holding every class and tag of the copied annotations
+copy_unchanged_anns = bool(strtobool(os.getenv('COPY_UNCHANGED_ANNS', 'false')))
+convert_json_native = bool(strtobool(os.getenv('CONVERT_JSON_NATIVE', 'true')))
+speculative_conversion = bool(strtobool(os.getenv('SPECULATIVE_CONVERSION', 'false')))   # convert in stats pass
+ann_decode_processes = int(os.getenv('ANN_DECODE_PROCESSES', 0))   # 0 to decode annotations in the app process
+ann_decode_chunk_size = int(os.getenv('ANN_DECODE_CHUNK_SIZE', 16))   # annotations per task of decoding process
+# Directory of per-dataset tag statistics reused by later runs, empty to disable. A dataset's entry is valid
+# while its updated_at, items_count and the project meta are unchanged; set it only where editing annotation
+# tags is known to change the dataset's updated_at, otherwise stale statistics are used without an error.
+stats_cache_dir = os.getenv('STATS_CACHE_DIR', '')
+resumable = bool(strtobool(os.getenv('RESUMABLE', 'false')))   # journal in data dir to continue interrupted runs
+stream_image_infos = bool(strtobool(os.getenv('STREAM_IMAGE_INFOS', 'true')))
+async_io = bool(strtobool(os.getenv('ASYNC_IO', 'false')))   # bulk requests over a pooled async session
+async_io_concurrency = int(os.getenv('ASYNC_IO_CONCURRENCY', 8))   # requests at once, also download prefetch
+async_io_retries = int(os.getenv('ASYNC_IO_RETRIES', 5))
+if async_io and importlib.util.find_spec('httpx') is None:
+    raise RuntimeError('ASYNC_IO=true needs the httpx package, which is not installed. '
+                       'Install it with "pip install httpx" or set ASYNC_IO=false')
+
+download_batch_size_min = int(os.getenv('DOWNLOAD_BATCH_SIZE_MIN', 10))
+download_batch_size_max = int(os.getenv('DOWNLOAD_BATCH_SIZE_MAX', 500))
+upload_batch_size_min = int(os.getenv('UPLOAD_BATCH_SIZE_MIN', 10))
+upload_batch_size_max = int(os.getenv('UPLOAD_BATCH_SIZE_MAX', 500))
+batch_target_seconds = float(os.getenv('BATCH_TARGET_SECONDS', 2.0))
+batch_max_payload_bytes = int(os.getenv('BATCH_MAX_PAYLOAD_BYTES', 32 << 20))
+run_report_log_interval = float(os.getenv('RUN_REPORT_LOG_INTERVAL', 0))   # seconds, 0 to log only at the end
+# measure every annotation payload for bytes_downloaded / bytes_uploaded, costs one more serialization of each json
+run_report_payload_bytes = bool(strtobool(os.getenv('RUN_REPORT_PAYLOAD_BYTES', 'false')))
+
+# batch mode (batch.py): the listed projects or all image projects of the workspace are converted in one process
+batch_project_ids = [int(i) for i in os.getenv('BATCH_PROJECT_IDS', '').split(',') if i.strip()]
+batch_workspace_id = int(os.getenv('BATCH_WORKSPACE_ID', 0))
+batch_projects_in_flight = int(os.getenv('BATCH_PROJECTS_IN_FLIGHT', 2))
+
+# preflight (preflight.py): estimates from a sample of every dataset, nothing is created
+preflight_sample_fraction = float(os.getenv('PREFLIGHT_SAMPLE_FRACTION', 0.05))
+preflight_min_sample_images = int(os.getenv('PREFLIGHT_MIN_SAMPLE_IMAGES', 20))   # per dataset
+preflight_seed = int(os.getenv('PREFLIGHT_SEED', 0))
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+import supervisely as sly
+from supervisely.io.json import dump_json_file, load_json_file
+
+
+def journal_key(**inputs) -> str:
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class ConversionJournal:
+    # Progress of one conversion run, kept until the run finishes successfully. state.json holds the result
+    # project, dataset mapping and tag stats; batches.jsonl gets a line per batch uploaded completely.
+    def __init__(self, root_dir: str, key: str):
+        self.dir = os.path.join(root_dir, 'journal', key)
+        sly.fs.mkdir(self.dir)
+        self._state_path = os.path.join(self.dir, 'state.json')
+        self._batches_path = os.path.join(self.dir, 'batches.jsonl')
+        self._lock = threading.Lock()
+
+        self._state = load_json_file(self._state_path) if os.path.isfile(self._state_path) else {}
+        self._state.setdefault('datasets', {})
+        self._done_src_ids = defaultdict(set)    # src dataset id -> src image ids
+        self._done_res_ids = defaultdict(set)    # res dataset id -> res image ids
+        self._read_batches()
+
+    @property
+    def is_resumed(self) -> bool:
+        return bool(self._state.get('res_project_id'))
+
+    def _read_batches(self):
+        if not os.path.isfile(self._batches_path):
+            return
+        valid_size = 0
+        with open(self._batches_path, 'rb') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:    # last line of interrupted write
+                    break
+                valid_size += len(line)
+                self._done_src_ids[rec['src_dataset_id']].update(rec['src_img_ids'])
+                self._done_res_ids[rec['res_dataset_id']].update(rec['res_img_ids'])
+        if valid_size < os.path.getsize(self._batches_path):
+            os.truncate(self._batches_path, valid_size)
+
+    def _save_state(self):
+        tmp_path = self._state_path + '.tmp'
+        dump_json_file(self._state, tmp_path)
+        os.replace(tmp_path, self._state_path)
+
+    @property
+    def res_project_id(self) -> Optional[int]:
+        return self._state.get('res_project_id')
+
+    def set_res_project_id(self, res_project_id: int):
+        # progress made for another result project is void
+        with self._lock:
+            self._state['res_project_id'] = res_project_id
+            self._state['datasets'] = {}
+            self._save_state()
+            sly.fs.silent_remove(self._batches_path)
+            self._done_src_ids.clear()
+            self._done_res_ids.clear()
+
+    @property
+    def datasets(self) -> Dict[int, int]:
+        return {int(src_id): res_id for src_id, res_id in self._state['datasets'].items()}
+
+    def add_dataset(self, src_dataset_id: int, res_dataset_id: int):
+        with self._lock:
+            self._state['datasets'][str(src_dataset_id)] = res_dataset_id
+            self._save_state()
+
+    @property
+    def tags_stats(self) -> Optional[dict]:
+        return self._state.get('tags_stats')
+
+    def set_tags_stats(self, tags_stats_json: dict):
+        with self._lock:
+            self._state['tags_stats'] = tags_stats_json
+            self._save_state()
+
+    def add_batch(self, src_dataset_id: int, src_img_ids, res_dataset_id: int, res_img_ids):
+        rec = {
+            'src_dataset_id': src_dataset_id,
+            'src_img_ids': list(src_img_ids),
+            'res_dataset_id': res_dataset_id,
+            'res_img_ids': list(res_img_ids),
+        }
+        with self._lock:
+            with open(self._batches_path, 'a') as f:
+                f.write(json.dumps(rec) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._done_src_ids[src_dataset_id].update(src_img_ids)
+            self._done_res_ids[res_dataset_id].update(res_img_ids)
+
+    def done_src_img_ids(self, src_dataset_id: int) -> Set[int]:
+        return self._done_src_ids[src_dataset_id]
+
+    def done_res_img_ids(self, res_dataset_id: int) -> Set[int]:
+        return self._done_res_ids[res_dataset_id]
+
+    @property
+    def done_images_cnt(self) -> int:
+        return sum(len(ids) for ids in self._done_src_ids.values())
+
+    def remove(self):
+        sly.fs.remove_dir(self.dir)
@@ -1,11 +1,28 @@
-from typing import List, Set
+import os
+import time
+import threading
+from typing import List, Optional
 
 import debug_load_envs  # before import sly
 import supervisely as sly
+from supervisely.io.json import dump_json_file
 
 from project_commons import ProjectCommons
-from ann_provider import AnnProvider, AnnMemCache, AnnDiskCacheRemovable, AnnDiskCachePersistent
-from tags_stats import TagsStatsConstructor, TagsStats, TagMetaChecks
+from ann_provider import (AnnProvider, AnnDiskCacheRemovable, AnnDiskCachePersistent,
+                          AnnShardCacheRemovable, AnnShardCachePersistent, AnnTieredCache, AnnNoCache)
+from tags_stats import (TagsStatsConstructor, TagsStats, TagMetaChecks, different_shapes_error,
+                        intersected_tags_error)
+from ann_convertor import AnnConvertor
+from ann_decoder import AnnDecoderPool
+from pipeline import BatchPipeline, PipelineStage
+from batching import AdaptiveBatchSize
+from ann_provider import serialize_ann_json
+from journal import ConversionJournal, journal_key
+from run_report import run_report
+from async_api import AsyncApiBridge
+from stats_cache import DatasetStatsCache
+from spool import ConversionSpool
+from memory_watchdog import MemoryWatchdog, acquire_memory_watchdog, release_memory_watchdog
 import globals as g
 
 
@@ -38,21 +55,27 @@ def tag_is_appropriate(tag_name: str, project: ProjectCommons, tags_stats: TagsS
     elif not tags_stats.is_in_use(tag_name):
         sly.logger.warn(f'Inappropriate tag: not associated with any object. {tag_name=}')
     elif not tags_stats.has_single_geom_type(tag_name):
-        raise ValueError(f'Inappropriate tag: associated with objects of different shapes. {tag_name=}')
+        raise different_shapes_error(tag_name)
     else:
         return True
 
     return False
 
 
+def speculative_tag_names(selected_tags: List[str], project: ProjectCommons) -> List[str]:
+    # tags passing the checks which don't need stats; others are rejected by validation anyway
+    res = []
+    for tag_name in set(selected_tags):
+        tag_checks = TagMetaChecks(project.meta.tag_metas.get(tag_name))
+        if tag_checks.has_appropriate_targets() and tag_checks.has_appropriate_value_type():
+            res.append(tag_name)
+    return res
+
+
 def ensure_tag_set_is_appropriate(tag_names: List[str], tags_stats: TagsStats) -> None:
     if not tags_stats.have_not_intersected(tag_names) and not g.handle_multiple_tags:
         example = tags_stats.example_intersected(tag_names)
-        guide_link = "https://developer.supervisely.com/getting-started/python-sdk-tutorials/images/image-and-object-tags#retrieve-images-with-object-tags-of-interest"
-        raise ValueError(f'Found object(s) containing multiple tags from selected set. '
-                         f'Tag names example: {example}. '
-                         f'Check "Handle multiple tags on a single object" option in the modal window, or '
-                         f'see how to retrieve such images here: "{guide_link}"')
+        raise intersected_tags_error(example)
 
     class_names_rest = tags_stats.classes_not_covered_entirely(tag_names)
     class_tag_name_inters = set(tag_names).intersection(class_names_rest)
@@ -112,64 +135,277 @@ class ProjectMetaConstructor:
         return res_meta
 
 
-class AnnConvertor:
-    def __init__(self, appropriate_tags: List[str], src_meta: sly.ProjectMeta, res_meta: sly.ProjectMeta):
-        self.tags_to_convert = set(appropriate_tags)
-        self.src_meta = src_meta
-        self.res_meta = res_meta
-
-        self.multiple_tags_converted = False
-
-    def convert(self, ann: sly.Annotation):
-        self.multiple_tags_converted = False
-        res_labels = self._convert_labels(ann.labels)
-        res_img_tags = self._convert_tags(ann.img_tags, tags_to_rm=set())
-        return ann.clone(labels=res_labels, img_tags=res_img_tags)
-
-    def _convert_tags(self, tags: sly.TagCollection, tags_to_rm: Set[str]):
-        return sly.TagCollection([self._convert_tag(t) for t in tags if t.name not in tags_to_rm])
-
-    def _convert_tag(self, tag: sly.Tag):
-        new_tag_meta = self.res_meta.tag_metas.get(tag.name)
-        return tag.clone(meta=new_tag_meta)
-
-    def _convert_labels(self, labels: List[sly.Label]):
-        ignore_multiple_tags = g.handle_option == 'ignore'
-        return [new_label for lbl in labels for new_label in self._convert_label(lbl, ignore_multiple_tags)]
-
-    def _convert_label(self, label: sly.Label, ignore_multiple_tags: bool = True):
-        important_tags = self.tags_to_convert.intersection(t.name for t in label.tags)
-        if not important_tags:
-            yield label
-            return
-        
-        if len(important_tags) > 1:
-            self.multiple_tags_converted = True
-        important_tags = list(important_tags) if not ignore_multiple_tags else [next(iter(important_tags))]
-        for tag_name in important_tags:
-            new_cls = self.res_meta.obj_classes.get(tag_name)
-            new_tags = self._convert_tags(label.tags, tags_to_rm=important_tags)
-            yield label.clone(obj_class=new_cls, tags=new_tags)
+def create_transitional_project_meta(src_meta: sly.ProjectMeta, res_meta: sly.ProjectMeta) -> sly.ProjectMeta:
+    # classes of both metas, so annotations stay valid while they are converted in place
+    new_classes = []
+    for res_class in res_meta.obj_classes:
+        src_class = src_meta.obj_classes.get(res_class.name)
+        if src_class is None:
+            new_classes.append(res_class)
+        elif src_class.geometry_type != res_class.geometry_type:
+            raise ValueError(f'Unable to convert in place: class {res_class.name!r} already exists '
+                             f'with another shape ({src_class.geometry_type.geometry_name()}).')
+    return src_meta.add_obj_classes(new_classes)
 
 
 class DatasetShadowCreator:
-    def __init__(self, api: sly.Api, res_project_id: int):
+    def __init__(self, api: sly.Api, res_project_id: int, journal: Optional[ConversionJournal] = None):
         self._api = api
         self._res_project_id = res_project_id
         self._map = {}
+        self._lock = threading.Lock()
+        self._journal = journal
 
     def get_new(self, src_ds_info):
-        res_info = self._map.get(src_ds_info.id)
-        if res_info is None:
-            res_info = self._api.dataset.create(self._res_project_id, src_ds_info.name,
-                                                change_name_if_conflict=True)
+        with self._lock:
+            res_info = self._map.get(src_ds_info.id)
+            if res_info is None and self._journal is not None:
+                res_ds_id = self._journal.datasets.get(src_ds_info.id)
+                if res_ds_id is not None:
+                    res_info = self._api.dataset.get_info_by_id(res_ds_id)
+            if res_info is None:
+                res_info = self._api.dataset.create(self._res_project_id, src_ds_info.name,
+                                                    change_name_if_conflict=True)
+                if self._journal is not None:
+                    self._journal.add_dataset(src_ds_info.id, res_info.id)
             self._map[src_ds_info.id] = res_info
         return res_info
 
 
+def remove_incomplete_images(api: sly.Api, journal: ConversionJournal) -> None:
+    # images uploaded by a batch which was interrupted before its annotations were uploaded
+    for res_ds_id in journal.datasets.values():
+        done_img_ids = journal.done_res_img_ids(res_ds_id)
+        incomplete_img_ids = [i.id for i in api.image.get_list(res_ds_id) if i.id not in done_img_ids]
+        if incomplete_img_ids:
+            sly.logger.warn(f'Removing images of interrupted batches. {res_ds_id=} count={len(incomplete_img_ids)}')
+            api.image.remove_batch(incomplete_img_ids)
+
+
+def skip_done_images(batches_data, journal: ConversionJournal):
+    for ds_info, img_ids, img_hashes, img_names in batches_data:
+        done_img_ids = journal.done_src_img_ids(ds_info.id)
+        keep = [idx for idx, img_id in enumerate(img_ids) if img_id not in done_img_ids]
+        if not keep:
+            continue
+        if len(keep) < len(img_ids):
+            img_ids, img_hashes, img_names = (tuple(seq[idx] for idx in keep)
+                                              for seq in (img_ids, img_hashes, img_names))
+        yield ds_info, img_ids, img_hashes, img_names
+
+
+class ConversionBatch:
+    def __init__(self, ds_info, img_ids, img_hashes, img_names):
+        self.ds_info = ds_info
+        self.img_ids = img_ids
+        self.img_hashes = img_hashes
+        self.img_names = img_names
+        self.res_ann_jsons = None    # only for images at converted_idxs
+        self.converted_idxs = []
+        self.res_ds_id = None
+        self.res_img_ids = None
+        self.multiple_tags_img_ids = []
+        self.upload_seconds = 0.0
+
+
+def create_batch_sizer(name: str, min_size: int, max_size: int) -> AdaptiveBatchSize:
+    return AdaptiveBatchSize(name, min_size=min_size, max_size=max_size,
+                             target_seconds=g.batch_target_seconds, max_payload_bytes=g.batch_max_payload_bytes)
+
+
+def create_conversion_pipeline(api: sly.Api, ann_provider: AnnProvider, ann_convertor: AnnConvertor,
+                               dataset_creator: Optional[DatasetShadowCreator],
+                               upload_batch_sizer: AdaptiveBatchSize,
+                               journal: Optional[ConversionJournal] = None,
+                               spool: Optional[ConversionSpool] = None) -> BatchPipeline:
+    # without dataset_creator annotations are converted in place, only changed ones are uploaded
+    in_place = dataset_creator is None
+    # annotations without converted labels are kept (in place) or copied on server side along with images
+    skip_unchanged = in_place or g.copy_unchanged_anns
+
+    def download_and_convert(dataset_id: int, img_ids: List[int]):
+        if g.convert_json_native:
+            ann_jsons = ann_provider.get_ann_jsons_by_img_ids(dataset_id, img_ids)
+            convert_ann = ann_convertor.convert_json
+        else:
+            ann_jsons = ann_provider.get_anns_by_img_ids(dataset_id, img_ids)
+            convert_ann = lambda ann: ann_convertor.convert(ann).to_json()
+
+        for img_id, ann in zip(img_ids, ann_jsons):
+            t0 = time.perf_counter()
+            res_ann_json = convert_ann(ann)
+            run_report.observe('convert', time.perf_counter() - t0)
+            yield img_id, res_ann_json, ann_convertor.labels_converted, ann_convertor.multiple_tags_converted
+
+    def convert_anns(batch: ConversionBatch):
+        # (img_id, res_ann_json, labels_converted, multiple_tags_converted)
+        res_ann_jsons = spool.get(batch.ds_info.id, batch.img_ids) if spool is not None else None
+        if res_ann_jsons is None:
+            yield from download_and_convert(batch.ds_info.id, batch.img_ids)
+            return
+
+        # only stale annotations of the batch are downloaded again
+        stale_img_ids = [img_id for img_id, res_ann_json in zip(batch.img_ids, res_ann_jsons) if res_ann_json is None]
+        reconverted = {}
+        if stale_img_ids:
+            reconverted = {res[0]: res for res in download_and_convert(batch.ds_info.id, stale_img_ids)}
+            run_report.count('anns_reconverted', len(stale_img_ids))
+        for img_id, res_ann_json in zip(batch.img_ids, res_ann_jsons):
+            if res_ann_json is None:
+                yield reconverted[img_id]
+            else:
+                yield (img_id, res_ann_json, img_id in spool.converted_img_ids,
+                       img_id in spool.multiple_tags_img_ids)
+
+    def convert(batch: ConversionBatch):
+        batch.res_ann_jsons = []
+        if in_place:
+            batch.res_ds_id = batch.ds_info.id
+            batch.res_img_ids = batch.img_ids
+        for idx, (img_id, res_ann_json, labels_converted, multiple_tags) in enumerate(convert_anns(batch)):
+            if multiple_tags:
+                batch.multiple_tags_img_ids.append(img_id)
+            if skip_unchanged and not labels_converted:
+                continue
+            batch.converted_idxs.append(idx)
+            batch.res_ann_jsons.append(res_ann_json)
+        return batch
+
+    def upload_images(batch: ConversionBatch):
+        res_ds_info = dataset_creator.get_new(batch.ds_info)
+        batch.res_ds_id = res_ds_info.id
+        t0 = time.perf_counter()
+        new_img_infos = api.image.upload_ids(res_ds_info.id, names=batch.img_names, ids=batch.img_ids)
+        seconds = time.perf_counter() - t0
+        run_report.observe('api.upload_ids', seconds)
+        run_report.count('images_uploaded', len(new_img_infos))
+        batch.upload_seconds += seconds
+        batch.res_img_ids = [i.id for i in new_img_infos]
+        return batch
+
+    def upload_anns(batch: ConversionBatch):
+        payload_bytes = 0
+        bytes_per_ann = ann_provider.bytes_per_ann
+        if batch.converted_idxs:
+            res_img_ids = [batch.res_img_ids[idx] for idx in batch.converted_idxs]
+            t0 = time.perf_counter()
+            api.annotation.upload_jsons(res_img_ids, batch.res_ann_jsons)
+            seconds = time.perf_counter() - t0
+            batch.upload_seconds += seconds
+            run_report.observe('api.upload_anns', seconds)
+            run_report.count('anns_uploaded', len(batch.res_ann_jsons))
+            if g.run_report_payload_bytes:
+                payload_bytes = sum(len(serialize_ann_json(ann_json)) for ann_json in batch.res_ann_jsons)
+                run_report.count('bytes_uploaded', payload_bytes)
+            elif bytes_per_ann is not None:
+                # converted annotations are about the size of the source ones
+                payload_bytes = int(len(batch.res_ann_jsons) * bytes_per_ann)
+            else:
+                payload_bytes = None
+
+        unchanged_idxs = sorted(set(range(len(batch.img_ids))) - set(batch.converted_idxs))
+        if in_place:
+            run_report.count('anns_unchanged', len(unchanged_idxs))
+        elif unchanged_idxs:
+            t0 = time.perf_counter()
+            api.annotation.copy_batch_by_ids([batch.img_ids[idx] for idx in unchanged_idxs],
+                                             [batch.res_img_ids[idx] for idx in unchanged_idxs])
+            seconds = time.perf_counter() - t0
+            batch.upload_seconds += seconds
+            run_report.observe('api.copy_anns', seconds)
+            run_report.count('anns_copied', len(unchanged_idxs))
+        upload_batch_sizer.record(len(batch.img_ids), payload_bytes, batch.upload_seconds)
+        if journal is not None:
+            journal.add_batch(batch.ds_info.id, batch.img_ids, batch.res_ds_id, batch.res_img_ids)
+        batch.res_ann_jsons = None
+        return batch
+
+    stages = [PipelineStage('convert', convert, workers=g.pipeline_convert_workers)]
+    if not in_place:
+        stages.append(PipelineStage('upload_images', upload_images))    # single worker keeps image order
+    stages.append(PipelineStage('upload_anns', upload_anns, workers=g.pipeline_upload_workers))
+    return BatchPipeline(stages, max_in_flight=g.pipeline_max_in_flight)
+
+
+def collect_tags_stats(project: ProjectCommons, ann_provider: AnnProvider, selected_tags: List[str],
+                       stats_cache: Optional[DatasetStatsCache] = None,
+                       spool: Optional[ConversionSpool] = None) -> TagsStats:
+    def create_constructor():
+        return TagsStatsConstructor(project.meta, selected_tags=list(set(selected_tags)),
+                                    allow_intersections=g.handle_multiple_tags)
+
+    # stats are collected per dataset, so unchanged datasets can be taken from cache
+    progress = sly.Progress('Collecting tags data', len(project), min_report_percent=5)
+    ds_stats = {}
+    ds_infos_to_read = []
+    for ds_info in project.ds_infos:
+        cached_stats = stats_cache.load(ds_info) if stats_cache is not None else None
+        if cached_stats is not None:
+            sly.logger.debug(f'Tag statistics of dataset are taken from cache. {ds_info.id=}')
+            ds_stats[ds_info.id] = cached_stats
+            progress.iters_done_report(ds_info.items_count)
+        else:
+            ds_infos_to_read.append(ds_info)
+
+    ds_constructors = {ds_info.id: create_constructor() for ds_info in ds_infos_to_read}
+    for ds_info, img_ids, ann_jsons in ann_provider.get_ann_json_batches(ds_infos_to_read):
+        ds_constructor = ds_constructors[ds_info.id]
+        for ann_json in ann_jsons:
+            t0 = time.perf_counter()
+            ds_constructor.update_with_annotation_json(ann_json)
+            run_report.observe('stats_update', time.perf_counter() - t0)
+        if spool is not None:
+            spool.add(ds_info.id, img_ids, ann_jsons)
+        progress.iters_done_report(len(img_ids))
+    for ds_info in ds_infos_to_read:
+        ds_stats[ds_info.id] = ds_constructors.pop(ds_info.id).get_stats()
+        if stats_cache is not None:
+            stats_cache.save(ds_info, ds_stats[ds_info.id])
+
+    tags_stats_constructor = create_constructor()
+    for ds_info in project.ds_infos:
+        tags_stats_constructor.update_with_stats(ds_stats[ds_info.id])
+    return tags_stats_constructor.get_stats()
+
+
+def create_async_api(api: sly.Api) -> Optional[AsyncApiBridge]:
+    if not g.async_io:
+        return None
+    return AsyncApiBridge.from_api(api, concurrency=g.async_io_concurrency, retries=g.async_io_retries)
+
+
 @sly.timeit
-def tags_to_classes(api: sly.Api, selected_tags: List[str], result_project_name: str):
-    project = ProjectCommons(api, g.project_id)
+def tags_to_classes(api: sly.Api, project_id: int, selected_tags: List[str], result_project_name: str):
+    async_api = create_async_api(api)
+    try:
+        convert_project(async_api or api, project_id, selected_tags, result_project_name,
+                        g.data_directory, g.temp_data_directory)
+    finally:
+        if async_api is not None:
+            async_api.close()
+
+
+def convert_project(api: sly.Api, project_id: int, selected_tags: List[str], result_project_name: str,
+                    data_dir: str, temp_dir: str):
+    # data_dir and temp_dir belong to this conversion: journal, statistics, report and annotation caches
+    run_report.start_periodic_log(g.run_report_log_interval)
+    memory_watchdog = acquire_memory_watchdog(g.memory_soft_ratio, g.memory_hard_ratio, g.memory_watchdog_interval,
+                                              limit_bytes=g.memory_limit_bytes)
+    try:
+        _tags_to_classes(api, project_id, selected_tags, result_project_name, data_dir, temp_dir, memory_watchdog)
+    finally:
+        if memory_watchdog is not None:
+            run_report.add_counters('memory', memory_watchdog.counters)    # of the whole process
+            release_memory_watchdog(memory_watchdog)
+        run_report.stop_periodic_log()
+        run_report_path = os.path.join(data_dir, 'run_report.json')
+        run_report.save(run_report_path)
+        sly.logger.info(f'Run report is saved: {run_report_path!r}', extra=run_report.to_json())
+
+
+def _tags_to_classes(api: sly.Api, project_id: int, selected_tags: List[str], result_project_name: str,
+                     data_dir: str, temp_dir: str, memory_watchdog: Optional[MemoryWatchdog] = None):
+    project = ProjectCommons(api, project_id, stream_images=g.stream_image_infos)
 
     if not result_project_name:
         result_project_name = f'{project.info.name} Untagged'
@@ -178,33 +414,89 @@ def tags_to_classes(api: sly.Api, selected_tags: List[str], result_project_name:
 
     beware_of_nonexistent_tags(selected_tags, project)
 
-    # ann_cache = AnnDiskCachePersistent(g.temp_data_directory)   # for debugging purposes
-    if len(project) < g.anns_in_memory_limit:
-        ann_cache = AnnMemCache()
+    journal = None
+    if g.resumable:
+        key_inputs = dict(project_id=project.info.id, selected_tags=sorted(set(selected_tags)),
+                          handle_multiple_tags=g.handle_multiple_tags, handle_option=g.handle_option)
+        if g.in_place:
+            # the run changes the project itself, so updated_at would not match after an interruption
+            key = journal_key(**key_inputs, in_place=True)
+        else:
+            key = journal_key(**key_inputs, project_updated_at=project.info.updated_at,
+                              result_project_name=result_project_name)
+        journal = ConversionJournal(data_dir, key)
+        sly.logger.info(f'Conversion journal: {journal.dir!r}', extra={'resumed': journal.is_resumed})
+
+    spool = None
+    # ann_disk_cache = AnnShardCachePersistent(temp_dir)   # for debugging purposes
+    if g.speculative_conversion and g.convert_json_native:
+        # annotations are read once: converted during the stats pass, so no cache is needed.
+        # Only annotations converted differently with the final tag set are downloaded again
+        spec_convertor = AnnConvertor(speculative_tag_names(selected_tags, project), src_meta=project.meta,
+                                      res_meta=project.meta, handle_option=g.handle_option)   # json needs no classes
+        spool = ConversionSpool(temp_dir, spec_convertor, tracked_tags=set(selected_tags))
+        ann_cache = AnnNoCache()
+    elif journal is not None:
+        # annotations downloaded before an interruption are reused
+        if g.ann_disk_cache_type == 'files':
+            ann_disk_cache = AnnDiskCachePersistent(journal.dir)
+        else:
+            ann_disk_cache = AnnShardCachePersistent(journal.dir)
+    elif g.ann_disk_cache_type == 'files':
+        ann_disk_cache = AnnDiskCacheRemovable(temp_dir)
     else:
-        ann_cache = AnnDiskCacheRemovable(g.temp_data_directory)
-    sly.logger.debug(f'Ann cache type: {type(ann_cache)}')
-    ann_provider = AnnProvider(api, project, ann_cache=ann_cache)
-
-    tags_stats_constructor = TagsStatsConstructor(project.meta)
-    progress = sly.Progress('Collecting tags data', len(project), min_report_percent=5)
-    for ann in ann_provider.get_anns():
-        tags_stats_constructor.update_with_annotation(ann)
-        progress.iter_done_report()
-
-    tags_stats = tags_stats_constructor.get_stats()
+        ann_disk_cache = AnnShardCacheRemovable(temp_dir)
+    if spool is None:
+        ann_cache = AnnTieredCache(ann_disk_cache, memory_budget_bytes=g.ann_cache_memory_bytes)
+        sly.logger.debug(f'Ann cache: disk tier {type(ann_disk_cache)}, '
+                         f'memory budget {g.ann_cache_memory_bytes} bytes')
+        if memory_watchdog is not None:
+            memory_watchdog.watch(ann_cache)
+    download_batch_sizer = create_batch_sizer('download', g.download_batch_size_min, g.download_batch_size_max)
+    ann_decoder = None
+    if not g.convert_json_native and g.ann_decode_processes > 0:
+        ann_decoder = AnnDecoderPool(project.meta, g.ann_decode_processes, chunk_size=g.ann_decode_chunk_size)
+    ann_provider = AnnProvider(api, project, ann_cache=ann_cache, download_batch_sizer=download_batch_sizer,
+                               ann_decoder=ann_decoder, download_prefetch=g.async_io_concurrency if g.async_io else 1,
+                               count_payload_bytes=g.run_report_payload_bytes)
+
+    with run_report.stage('stats_pass'):
+        if journal is not None and journal.tags_stats is not None:
+            tags_stats = TagsStats.from_json(journal.tags_stats, project.meta)
+            sly.logger.info('Tag statistics are restored from journal')
+        else:
+            stats_cache = None
+            if g.stats_cache_dir:
+                stats_cache = DatasetStatsCache(g.stats_cache_dir, project.info.id, project.meta)
+            tags_stats = collect_tags_stats(project, ann_provider, selected_tags, stats_cache, spool=spool)
+            if stats_cache is not None:
+                run_report.add_counters('stats_cache', stats_cache.counters)
+            if journal is not None:
+                journal.set_tags_stats(tags_stats.to_json())
     sly.logger.info('Tag statistics are collected', extra={
         'total_tags_cnt': len(project.meta.tag_metas),
-        'total_objects_cnt': tags_stats.objects_count
+        'total_objects_cnt': tags_stats.objects_count,
+        'unique_signatures_cnt': tags_stats.signatures_count,
     })
+    tags_stats_path = os.path.join(data_dir, 'tags_stats.json')
+    sly.fs.ensure_base_path(tags_stats_path)
+    dump_json_file(tags_stats.to_json(), tags_stats_path)
+    sly.logger.debug(f'Tag statistics are saved: {tags_stats_path!r}')
     for tag_meta in project.meta.tag_metas:
         debug_log_tag_stats(tag_meta, tags_stats)
 
     # Step 1: check selected tags
 
-    appropriate_tag_names = [t for t in set(selected_tags) if tag_is_appropriate(t, project, tags_stats)]
+    with run_report.stage('validation'):
+        appropriate_tag_names = [t for t in set(selected_tags) if tag_is_appropriate(t, project, tags_stats)]
+
+        ensure_tag_set_is_appropriate(appropriate_tag_names, tags_stats)
 
-    ensure_tag_set_is_appropriate(appropriate_tag_names, tags_stats)
+    if spool is not None:
+        stale_cnt = spool.invalidate(appropriate_tag_names)
+        if stale_cnt:
+            sly.logger.warn(f'Speculative conversion differs from the final one, {stale_cnt} annotations '
+                            f'will be converted again')
 
     # Step 2: convert annotations & upload
 
@@ -213,27 +505,87 @@ def tags_to_classes(api: sly.Api, selected_tags: List[str], result_project_name:
     sly.logger.info(f'Resulting tags: {sorted(t.name for t in res_meta.tag_metas)}')
     sly.logger.info(f'Resulting classes: {sorted(c.name for c in res_meta.obj_classes)}')
 
-    res_project_info = api.project.create(g.workspace_id, result_project_name,
-                                          type=sly.ProjectType.IMAGES, change_name_if_conflict=True)
-    api.project.update_meta(res_project_info.id, res_meta.to_json())
+    if g.in_place:
+        convert_in_place(api, project, res_meta, appropriate_tag_names, ann_provider, journal, spool)
+    else:
+        convert_to_new_project(api, project, res_meta, appropriate_tag_names, ann_provider, journal, spool,
+                               result_project_name)
+
+    if ann_decoder is not None:
+        ann_decoder.close()
+    if spool is not None:
+        spool.remove()
+    run_report.add_counters('ann_cache', ann_cache.counters)
+    if memory_watchdog is not None:
+        memory_watchdog.unwatch(ann_cache)
+    sly.logger.info('Batch sizes', extra={'download': download_batch_sizer.summary()})
+    if journal is not None:
+        journal.remove()
+    sly.logger.debug('Finished tags_to_classes')
+
+
+def convert_to_new_project(api: sly.Api, project: ProjectCommons, res_meta: sly.ProjectMeta,
+                           appropriate_tag_names: List[str], ann_provider: AnnProvider,
+                           journal: Optional[ConversionJournal], spool: Optional[ConversionSpool],
+                           result_project_name: str) -> None:
+    res_project_info = None
+    if journal is not None and journal.res_project_id is not None:
+        res_project_info = api.project.get_info_by_id(journal.res_project_id)
+    if res_project_info is None:
+        res_project_info = api.project.create(g.workspace_id, result_project_name,
+                                              type=sly.ProjectType.IMAGES, change_name_if_conflict=True)
+        api.project.update_meta(res_project_info.id, res_meta.to_json())
+        if journal is not None:
+            journal.set_res_project_id(res_project_info.id)
+    else:
+        sly.logger.info('Resuming conversion into existing project', extra={
+            'res_project_id': res_project_info.id,
+            'images_done_cnt': journal.done_images_cnt,
+        })
+        remove_incomplete_images(api, journal)
     sly.logger.info(f'Resulting project name: {res_project_info.name!r}')
 
-    ann_convertor = AnnConvertor(appropriate_tag_names, src_meta=project.meta, res_meta=res_meta)
-    dataset_creator = DatasetShadowCreator(api, res_project_info.id)
-    progress = sly.Progress('Converting classes', len(project))
-    converted_imgids = set()
-    for ds_info, img_ids, img_hashes, img_names in project.iterate_batched():
-        res_ds_info = dataset_creator.get_new(ds_info)
+    dataset_creator = DatasetShadowCreator(api, res_project_info.id, journal=journal)
+    run_conversion(api, project, res_meta, appropriate_tag_names, ann_provider, dataset_creator, journal, spool)
 
-        res_anns = []
-        for idx, ann in enumerate(ann_provider.get_anns_by_img_ids(ds_info.id, img_ids)):
-            res_anns.append(ann_convertor.convert(ann)) 
-            if ann_convertor.multiple_tags_converted:
-                converted_imgids.add(img_ids[idx])
-        new_img_infos = api.image.upload_ids(res_ds_info.id, names=img_names, ids=img_ids)
-        api.annotation.upload_anns([i.id for i in new_img_infos], res_anns)
 
-        progress.iters_done_report(len(img_ids))
+def convert_in_place(api: sly.Api, project: ProjectCommons, res_meta: sly.ProjectMeta,
+                     appropriate_tag_names: List[str], ann_provider: AnnProvider,
+                     journal: Optional[ConversionJournal], spool: Optional[ConversionSpool]) -> None:
+    # Classes are added before annotations are re-uploaded and removed after that,
+    # so no annotation ever references a class missing in the project meta.
+    sly.logger.info(f'Converting project in place: {project.info.name!r}')
+    if journal is not None and journal.res_project_id is None:
+        journal.set_res_project_id(project.info.id)
+    transitional_meta = create_transitional_project_meta(project.meta, res_meta)
+    api.project.update_meta(project.info.id, transitional_meta.to_json())
+
+    run_conversion(api, project, res_meta, appropriate_tag_names, ann_provider, None, journal, spool)
+
+    api.project.update_meta(project.info.id, res_meta.to_json())
+
+
+def run_conversion(api: sly.Api, project: ProjectCommons, res_meta: sly.ProjectMeta,
+                   appropriate_tag_names: List[str], ann_provider: AnnProvider,
+                   dataset_creator: Optional[DatasetShadowCreator], journal: Optional[ConversionJournal],
+                   spool: Optional[ConversionSpool]) -> None:
+    ann_convertor = AnnConvertor(appropriate_tag_names, src_meta=project.meta, res_meta=res_meta,
+                                 handle_option=g.handle_option)
+    upload_batch_sizer = create_batch_sizer('upload', g.upload_batch_size_min, g.upload_batch_size_max)
+    conversion_pipeline = create_conversion_pipeline(api, ann_provider, ann_convertor, dataset_creator,
+                                                     upload_batch_sizer, journal=journal, spool=spool)
+    progress = sly.Progress('Converting classes', len(project))
+    converted_imgids = set()
+    batches_data = project.iterate_batched(batch_sizer=upload_batch_sizer)
+    if journal is not None and journal.done_images_cnt:
+        progress.iters_done_report(journal.done_images_cnt)
+        batches_data = skip_done_images(batches_data, journal)
+    batches = (ConversionBatch(*batch_data) for batch_data in batches_data)
+    with run_report.stage('convert_upload'):
+        for batch in conversion_pipeline.run(batches):
+            converted_imgids.update(batch.multiple_tags_img_ids)
+            progress.iters_done_report(len(batch.img_ids))
+            run_report.count('images_processed', len(batch.img_ids))
 
     if g.handle_multiple_tags is True and len(converted_imgids) > 0:
         sly.logger.warn(
@@ -241,7 +593,13 @@ def tags_to_classes(api: sly.Api, selected_tags: List[str], result_project_name:
             f'Count of images featuring objects with multiple tags: {len(converted_imgids)}',
             extra={'original image_ids': list(converted_imgids)}
         )
-    sly.logger.debug('Finished tags_to_classes')
+    sly.logger.info('Annotations are converted', extra={
+        'uploaded_cnt': run_report.counters.get('anns_uploaded', 0),
+        'copied_cnt': run_report.counters.get('anns_copied', 0),
+        'unchanged_cnt': run_report.counters.get('anns_unchanged', 0),
+    })
+    run_report.add_counters('convert_memo', ann_convertor.memo_counters)
+    sly.logger.info('Batch sizes', extra={'upload': upload_batch_sizer.summary()})
 
 
 if __name__ == '__main__':
@@ -255,10 +613,11 @@ if __name__ == '__main__':
             'modal.state.resultProjectName': g.res_project_name,
             'modal.state.handleMulti': str(g.handle_multiple_tags),
             'modal.state.handleOption': g.handle_option,
+            'modal.state.inPlace': str(g.in_place),
         },
     )
 
-    tags_to_classes(g.api, g.selected_tags, g.res_project_name)
+    tags_to_classes(g.api, g.project_id, g.selected_tags, g.res_project_name)
 
     try:
         sly.app.fastapi.shutdown()
@@ -0,0 +1,158 @@
+import gc
+import weakref
+import threading
+from typing import Optional
+
+import psutil
+import supervisely as sly
+
+
+CGROUP_MEMORY_LIMIT_PATHS = [
+    '/sys/fs/cgroup/memory.max',                      # cgroup v2
+    '/sys/fs/cgroup/memory/memory.limit_in_bytes',    # cgroup v1
+]
+
+
+def get_memory_limit_bytes() -> int:
+    # container limit if there is one, physical memory otherwise
+    limit = psutil.virtual_memory().total
+    for path in CGROUP_MEMORY_LIMIT_PATHS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            limit = min(limit, int(value))    # v1 reports a huge number when unlimited
+    return limit
+
+
+class MemoryWatchdog:
+    # Samples RSS of the process in a background thread. Watched caches have memory_bytes and
+    # set_memory_budget(); past soft_bytes their memory tier is cut to a quarter of what it holds,
+    # past hard_bytes it is moved to disk completely. Levels only go up, so a cache is not refilled
+    # after it has been downgraded; reset() starts over from the current RSS. Caches are weakly
+    # referenced: a cache of a failed conversion is not kept alive by the watchdog.
+    LEVELS = ('normal', 'soft', 'hard')
+
+    def __init__(self, soft_bytes: int, hard_bytes: int, interval_seconds: float = 1.0):
+        if not 0 < soft_bytes <= hard_bytes:
+            raise ValueError(f'Wrong memory watchdog thresholds. {soft_bytes=} {hard_bytes=}')
+        self._soft_bytes = soft_bytes
+        self._hard_bytes = hard_bytes
+        self._interval_seconds = interval_seconds
+        self._process = psutil.Process()
+        self._caches = weakref.WeakSet()
+        self._level = 0
+        self._lock = threading.Lock()
+        self._stop = None
+        self.counters = {
+            'rss_bytes_peak': 0,
+            'downgrades': 0,
+        }
+
+    @property
+    def level(self) -> str:
+        return self.LEVELS[self._level]
+
+    def watch(self, cache) -> None:
+        with self._lock:
+            self._caches.add(cache)
+            if self._level > 0:
+                self._downgrade_cache(cache)
+
+    def unwatch(self, cache) -> None:
+        with self._lock:
+            self._caches.discard(cache)
+
+    def _downgrade_cache(self, cache) -> None:
+        budget = 0 if self._level == 2 else cache.memory_bytes // 4
+        cache.set_memory_budget(budget)
+
+    def check(self) -> str:
+        rss = self._process.memory_info().rss
+        level = 2 if rss >= self._hard_bytes else 1 if rss >= self._soft_bytes else 0
+        with self._lock:
+            self.counters['rss_bytes_peak'] = max(self.counters['rss_bytes_peak'], rss)
+            if level <= self._level:
+                return self.level
+            sly.logger.warn(f'Memory usage is high. Level: {self.LEVELS[self._level]!r} -> {self.LEVELS[level]!r}',
+                            extra={'rss_bytes': rss, 'soft_bytes': self._soft_bytes, 'hard_bytes': self._hard_bytes})
+            self._level = level
+            self.counters['downgrades'] += 1
+            caches = list(self._caches)
+            for cache in caches:
+                self._downgrade_cache(cache)
+        gc.collect()
+        sly.logger.info('Annotation cache is downgraded', extra={
+            'rss_bytes': self._process.memory_info().rss,
+            'cache_memory_bytes': [cache.memory_bytes for cache in caches],
+        })
+        return self.level
+
+    def reset(self) -> str:
+        # caches downgraded already keep their budgets, new ones are downgraded only if RSS is still high
+        with self._lock:
+            self._level = 0
+        return self.check()
+
+    def start(self) -> None:
+        if self._stop is not None:
+            return
+        self._stop = threading.Event()
+        self.check()
+
+        def sample_periodically(stop: threading.Event):
+            while not stop.wait(self._interval_seconds):
+                self.check()
+
+        threading.Thread(target=sample_periodically, args=(self._stop,), name='memory-watchdog', daemon=True).start()
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+
+def create_memory_watchdog(soft_ratio: float, hard_ratio: float, interval_seconds: float,
+                           limit_bytes: int = 0) -> Optional[MemoryWatchdog]:
+    if interval_seconds <= 0:
+        return None
+    limit_bytes = limit_bytes or get_memory_limit_bytes()
+    watchdog = MemoryWatchdog(int(limit_bytes * soft_ratio), int(limit_bytes * hard_ratio), interval_seconds)
+    sly.logger.debug(f'Memory watchdog: {limit_bytes=} {soft_ratio=} {hard_ratio=} {interval_seconds=}')
+    return watchdog
+
+
+# One watchdog per process: RSS is a process-wide value, so conversions running at once (batch mode) share
+# the sampling thread and are downgraded together. It is stopped when the last conversion releases it.
+_shared_lock = threading.Lock()
+_shared_watchdog = None
+_shared_users_cnt = 0
+
+
+def acquire_memory_watchdog(soft_ratio: float, hard_ratio: float, interval_seconds: float,
+                            limit_bytes: int = 0) -> Optional[MemoryWatchdog]:
+    global _shared_watchdog, _shared_users_cnt
+    with _shared_lock:
+        if _shared_watchdog is None:
+            _shared_watchdog = create_memory_watchdog(soft_ratio, hard_ratio, interval_seconds, limit_bytes)
+            if _shared_watchdog is None:
+                return None
+            _shared_watchdog.start()
+        elif _shared_watchdog.level != 'normal':
+            # memory freed by finished conversions is not held against this one
+            _shared_watchdog.reset()
+        _shared_users_cnt += 1
+        return _shared_watchdog
+
+
+def release_memory_watchdog(watchdog: MemoryWatchdog) -> None:
+    global _shared_watchdog, _shared_users_cnt
+    with _shared_lock:
+        if watchdog is not _shared_watchdog:
+            return
+        _shared_users_cnt -= 1
+        if _shared_users_cnt == 0:
+            _shared_watchdog.stop()
+            _shared_watchdog = None
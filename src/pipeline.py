@@ -0,0 +1,122 @@
+import queue
+import threading
+import contextvars
+from typing import Any, Callable, Iterable, Iterator, List
+
+
+_STOP = object()
+
+
+class PipelineStage:
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1):
+        if workers < 1:
+            raise ValueError(f'Pipeline stage needs at least one worker. {name=} {workers=}')
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class _OrderedEmitter:
+    # passes items downstream strictly in input order, whichever worker finishes first
+    def __init__(self, out_queue: queue.Queue):
+        self._out = out_queue
+        self._pending = {}
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def emit(self, seq: int, item):
+        with self._lock:
+            self._pending[seq] = item
+            while self._next_seq in self._pending:
+                self._out.put((self._next_seq, self._pending.pop(self._next_seq)))
+                self._next_seq += 1
+
+
+class _PipelineError:
+    def __init__(self, stage_name: str, exc: BaseException):
+        self.stage_name = stage_name
+        self.exc = exc
+
+
+# Each stage runs in its own pool of threads. At most max_in_flight batches are processed at once,
+# results are yielded in input order, the first error stops the pipeline and is re-raised from run().
+class BatchPipeline:
+    def __init__(self, stages: List[PipelineStage], max_in_flight: int = 4):
+        if not stages:
+            raise ValueError('Pipeline needs at least one stage')
+        if max_in_flight < 1:
+            raise ValueError(f'Pipeline needs at least one batch in flight. {max_in_flight=}')
+        self._stages = stages
+        self._max_in_flight = max_in_flight
+
+    def run(self, items: Iterable) -> Iterator:
+        queues = [queue.Queue() for _ in range(len(self._stages) + 1)]
+        emitters = [_OrderedEmitter(q) for q in queues[1:]]
+        in_flight = threading.Semaphore(self._max_in_flight)
+        stop = threading.Event()
+        out_queue = queues[-1]
+
+        def fail(stage_name, exc):
+            if not stop.is_set():
+                stop.set()
+                out_queue.put((None, _PipelineError(stage_name, exc)))
+
+        def feed():
+            seq = 0
+            try:
+                for item in items:
+                    while not in_flight.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    queues[0].put((seq, item))
+                    seq += 1
+            except BaseException as exc:
+                fail('input', exc)
+                return
+            out_queue.put((seq, _STOP))
+
+        def work(stage: PipelineStage, in_queue: queue.Queue, emitter: _OrderedEmitter):
+            while True:
+                seq, item = in_queue.get()
+                if item is _STOP:
+                    return
+                if stop.is_set():
+                    continue
+                try:
+                    res = stage.func(item)
+                except BaseException as exc:
+                    fail(stage.name, exc)
+                    continue
+                emitter.emit(seq, res)
+
+        def create_thread(target, name: str, *args) -> threading.Thread:
+            # threads see context variables of the caller, e.g. the run report of the current project
+            return threading.Thread(target=contextvars.copy_context().run, args=(target, *args), name=name, daemon=True)
+
+        threads = [create_thread(feed, 'pipeline-input')]
+        for stage, in_queue, emitter in zip(self._stages, queues, emitters):
+            threads.extend(create_thread(work, f'pipeline-{stage.name}-{i}', stage, in_queue, emitter)
+                           for i in range(stage.workers))
+        for t in threads:
+            t.start()
+
+        try:
+            # the input sentinel may arrive before the last results, so track the expected count
+            total, done = None, 0
+            while total is None or done < total:
+                seq, res = out_queue.get()
+                if isinstance(res, _PipelineError):
+                    raise res.exc
+                if res is _STOP:
+                    total = seq
+                    continue
+                done += 1
+                in_flight.release()
+                yield res
+        finally:
+            stop.set()
+            for stage, in_queue in zip(self._stages, queues):
+                for _ in range(stage.workers):
+                    in_queue.put((None, _STOP))
@@ -0,0 +1,224 @@
+import os
+import math
+import time
+import random
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import supervisely as sly
+from supervisely.io.json import dump_json_file
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.annotation.tag import TagJsonFields
+
+from project_commons import ProjectCommons
+from ann_provider import AnnProvider, AnnNoCache, serialize_ann_json
+from ann_convertor import AnnConvertor
+from tags_stats import (TagsStatsConstructor, TagsStats, TagMetaChecks, different_shapes_error,
+                        intersected_tags_error)
+from main import beware_of_nonexistent_tags, create_batch_sizer, ProjectMetaConstructor
+from run_report import RunReport, run_report, use_run_report
+import globals as g
+
+
+class SampleEstimator:
+    # Project totals of per-image values from a simple random sample of every dataset (stratified sampling).
+    # Bounds are normal approximation with finite population correction; for indicators never seen
+    # in a dataset sample the upper bound follows the rule of three.
+    def __init__(self, z: float = 1.96):
+        self._z = z
+        self._populations = {}
+        self._values = defaultdict(list)    # dataset_id -> per-image dicts of values
+
+    def add_dataset(self, dataset_id: int, population: int):
+        self._populations[dataset_id] = population
+
+    def add_image(self, dataset_id: int, values: Dict[str, float]):
+        self._values[dataset_id].append(values)
+
+    def estimate(self, name: str, indicator: bool = False) -> dict:
+        total, variance, extra_upper = 0.0, 0.0, 0.0
+        for dataset_id, population in self._populations.items():
+            values = [v.get(name, 0) for v in self._values[dataset_id]]
+            n = len(values)
+            if not n:
+                continue
+            mean = sum(values) / n
+            sample_var = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else 0.0
+            total += population * mean
+            variance += population ** 2 * (1 - n / population) * sample_var / n
+            if indicator and mean == 0 and n < population:
+                extra_upper += (population - n) * min(1.0, 3 / n)
+        margin = self._z * math.sqrt(variance)
+        return {
+            'estimate': total,
+            'lower': max(0.0, total - margin),
+            'upper': total + margin + extra_upper,
+        }
+
+
+def get_image_values(ann_json: dict, selected_tags: List[str]) -> Dict[str, float]:
+    values = defaultdict(float)
+    values['ann_bytes'] = len(serialize_ann_json(ann_json))
+    for obj in ann_json.get(AnnotationJsonFields.LABELS, []):
+        obj_tag_names = {tag[TagJsonFields.TAG_NAME] for tag in obj.get(LabelJsonFields.TAGS, [])}
+        obj_tags = [t for t in selected_tags if t in obj_tag_names]
+        values['objects'] += 1
+        values['objects_covered'] += bool(obj_tags)
+        values['objects_intersected'] += len(obj_tags) > 1
+        for t in obj_tags:
+            values[f'objects.{t}'] += 1
+            values[f'images.{t}'] = 1
+    values['images_intersected'] = float(values['objects_intersected'] > 0)
+    return values
+
+
+def check_selection(project: ProjectCommons, tags_stats: TagsStats,
+                    selected_tags: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    # Same checks as the conversion applies, collected instead of raised: errors would stop the conversion,
+    # tags with warnings would be skipped by it.
+    appropriate_tags, errors, warnings = [], [], []
+    for tag_name in selected_tags:
+        tag_checks = TagMetaChecks(project.meta.tag_metas.get(tag_name))
+        if not tag_checks.has_appropriate_targets():
+            warnings.append(f'Inappropriate tag: wrong targets (like "images_only"). {tag_name=}')
+        elif not tag_checks.has_appropriate_value_type():
+            warnings.append(f'Inappropriate tag: wrong value type (not None). {tag_name=}')
+        elif not tags_stats.is_in_use(tag_name):
+            warnings.append(f'Inappropriate tag: not associated with any sampled object. {tag_name=}')
+        elif not tags_stats.has_single_geom_type(tag_name):
+            errors.append(str(different_shapes_error(tag_name)))
+        else:
+            appropriate_tags.append(tag_name)
+
+    if not tags_stats.have_not_intersected(appropriate_tags) and not g.handle_multiple_tags:
+        errors.append(str(intersected_tags_error(tags_stats.example_intersected(appropriate_tags))))
+    class_name_inters = set(appropriate_tags).intersection(tags_stats.classes_not_covered_entirely(appropriate_tags))
+    if class_name_inters and not g.handle_multiple_tags:
+        errors.append(f'Inappropriate tag set: some tag has same name with remaining class. '
+                      f'Wrong names: {class_name_inters}')
+    return appropriate_tags, errors, warnings
+
+
+@sly.timeit
+def run_preflight(api: sly.Api, project_id: int, selected_tags: List[str], sample_fraction: float,
+                  min_sample_images: int, seed: int = 0, convert_sample_size: int = 200) -> dict:
+    # Reads a sample of annotations only, nothing is created or changed on the server.
+    selected_tags = sorted(set(selected_tags))
+    project = ProjectCommons(api, project_id, stream_images=True)
+    beware_of_nonexistent_tags(selected_tags, project)
+
+    download_batch_sizer = create_batch_sizer('download', g.download_batch_size_min, g.download_batch_size_max)
+    ann_provider = AnnProvider(api, project, ann_cache=AnnNoCache(), download_batch_sizer=download_batch_sizer)
+    stats_constructor = TagsStatsConstructor(project.meta)    # no selected tags: problems are reported, not raised
+    estimator = SampleEstimator()
+    rng = random.Random(seed)
+    convert_sample = []
+    images_cnt, sampled_cnt = 0, 0
+    report = RunReport()
+    with use_run_report(report):
+        for ds_info in project.ds_infos:
+            ds_img_ids = list(project.get_dataset_images(ds_info.id).ids)
+            project.release_dataset_images(ds_info.id)
+            estimator.add_dataset(ds_info.id, len(ds_img_ids))
+            images_cnt += len(ds_img_ids)
+            sample_size = min(len(ds_img_ids), max(min_sample_images, math.ceil(len(ds_img_ids) * sample_fraction)))
+            img_ids = sorted(rng.sample(ds_img_ids, sample_size))
+            start = 0
+            while start < len(img_ids):
+                batch_ids = img_ids[start:start + download_batch_sizer.size]
+                for ann_json in ann_provider.get_ann_jsons_by_img_ids(ds_info.id, batch_ids):
+                    t0 = time.perf_counter()
+                    stats_constructor.update_with_annotation_json(ann_json)
+                    run_report.observe('stats_update', time.perf_counter() - t0)
+                    estimator.add_image(ds_info.id, get_image_values(ann_json, selected_tags))
+                    if len(convert_sample) < convert_sample_size:
+                        convert_sample.append(ann_json)
+                start += len(batch_ids)
+            sampled_cnt += sample_size
+    tags_stats = stats_constructor.get_stats()
+    appropriate_tags, errors, warnings = check_selection(project, tags_stats, selected_tags)
+
+    convert_seconds_per_image, upload_bytes_ratio = None, None
+    if appropriate_tags and not errors:
+        res_meta = ProjectMetaConstructor(project.meta, tags_stats).create_new_project_meta(appropriate_tags)
+        ann_convertor = AnnConvertor(appropriate_tags, src_meta=project.meta, res_meta=res_meta,
+                                     handle_option=g.handle_option)
+        t0 = time.perf_counter()
+        res_ann_jsons = [ann_convertor.convert_json(ann_json) for ann_json in convert_sample]
+        convert_seconds_per_image = (time.perf_counter() - t0) / max(1, len(convert_sample))
+        upload_bytes_ratio = (sum(len(serialize_ann_json(ann_json)) for ann_json in res_ann_jsons) /
+                              max(1, sum(len(serialize_ann_json(ann_json)) for ann_json in convert_sample)))
+
+    download_seconds_per_image = report.timings['api.download_batch'].total / max(1, sampled_cnt)
+    stats_seconds_per_image = report.timings['stats_update'].total / max(1, sampled_cnt)
+    ann_bytes = estimator.estimate('ann_bytes')
+    expected_seconds = None
+    if convert_seconds_per_image is not None:
+        # rough: upload is assumed to cost as much as download of the same number of bytes
+        expected_seconds = {
+            'stats_pass': images_cnt * (download_seconds_per_image + stats_seconds_per_image),
+            'convert_upload': images_cnt * (convert_seconds_per_image +
+                                            download_seconds_per_image * upload_bytes_ratio),
+        }
+    return {
+        'project_id': project_id,
+        'images_cnt': images_cnt,
+        'sampled_images_cnt': sampled_cnt,
+        'sample_fraction': sampled_cnt / images_cnt if images_cnt else 0.0,
+        'confidence': 0.95,
+        'appropriate_tags': appropriate_tags,
+        'errors': errors,
+        'warnings': warnings,
+        'ann_bytes': ann_bytes,
+        'ann_cache': {
+            'memory_budget_bytes': g.ann_cache_memory_bytes,
+            'fits_memory_budget': ann_bytes['upper'] <= g.ann_cache_memory_bytes,
+        },
+        'objects': estimator.estimate('objects'),
+        'objects_covered': estimator.estimate('objects_covered'),
+        'objects_intersected': estimator.estimate('objects_intersected'),
+        'images_intersected': estimator.estimate('images_intersected', indicator=True),
+        'tags': {t: {
+            'objects': estimator.estimate(f'objects.{t}'),
+            'images': estimator.estimate(f'images.{t}', indicator=True),
+            'geometry_types': sorted(geom_type.geometry_name() for geom_type in tags_stats.geometry_types(t)),
+            'classes': sorted(tags_stats.classes(t)),
+        } for t in selected_tags},
+        'seconds_per_image': {
+            'download': download_seconds_per_image,
+            'stats_update': stats_seconds_per_image,
+            'convert': convert_seconds_per_image,
+        },
+        'expected_seconds': expected_seconds,
+    }
+
+
+if __name__ == '__main__':
+    sly.logger.info(
+        'Preflight arguments',
+        extra={
+            'modal.state.slyProjectId': g.project_id,
+            'modal.state.selectedTags.tags': g.selected_tags,
+            'modal.state.handleMulti': str(g.handle_multiple_tags),
+            'modal.state.handleOption': g.handle_option,
+            'sample_fraction': g.preflight_sample_fraction,
+            'min_sample_images': g.preflight_min_sample_images,
+        },
+    )
+
+    preflight_report = run_preflight(g.api, g.project_id, g.selected_tags, g.preflight_sample_fraction,
+                                     g.preflight_min_sample_images, seed=g.preflight_seed)
+    for error in preflight_report['errors']:
+        sly.logger.error(f'Preflight: {error}')
+    for warning in preflight_report['warnings']:
+        sly.logger.warn(f'Preflight: {warning}')
+    preflight_report_path = os.path.join(g.data_directory, 'preflight_report.json')
+    sly.fs.ensure_base_path(preflight_report_path)
+    dump_json_file(preflight_report, preflight_report_path)
+    sly.logger.info(f'Preflight report is saved: {preflight_report_path!r}', extra=preflight_report)
+
+    try:
+        sly.app.fastapi.shutdown()
+    except KeyboardInterrupt:
+        sly.logger.info('Application shutdown successfully')
@@ -1,8 +1,49 @@
+from array import array
+from typing import Callable, Iterable, Optional, Tuple
+
 import supervisely as sly
 
+from batching import AdaptiveBatchSize
+
+
+class _PackedStrings:
+    # strings as one utf-8 buffer with offsets, instead of a list of str objects
+    def __init__(self, strings: Iterable[str]):
+        self._data = bytearray()
+        self._offsets = array('q', [0])
+        for s in strings:
+            self._data += s.encode('utf-8')
+            self._offsets.append(len(self._data))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def slice(self, start: int, end: int) -> Tuple[str, ...]:
+        offsets = self._offsets[start:min(end, len(self)) + 1]
+        return tuple(self._data[b:e].decode('utf-8') for b, e in zip(offsets, offsets[1:]))
+
+
+class DatasetImages:
+    # only the fields needed for conversion, without full ImageInfo objects
+    def __init__(self, img_infos):
+        self.ids = array('q', (i.id for i in img_infos))
+        self.names = _PackedStrings(i.name for i in img_infos)
+        self.hashes = _PackedStrings(i.hash for i in img_infos)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def iterate_batched(self, get_batch_size: Callable[[], int]):
+        start = 0
+        while start < len(self.ids):
+            end = start + get_batch_size()
+            yield tuple(self.ids[start:end]), self.hashes.slice(start, end), self.names.slice(start, end)
+            start = end
+
 
 class ProjectCommons:
-    def __init__(self, api: sly.Api, project_id: int):
+    def __init__(self, api: sly.Api, project_id: int, stream_images: bool = False):
+        self._api = api
         self.info = api.project.get_info_by_id(project_id)
 
         meta_json = api.project.get_meta(project_id)
@@ -11,14 +52,35 @@ class ProjectCommons:
         self.ds_infos = api.dataset.get_list(project_id)
         self._items_count = sum(ds.items_count for ds in self.ds_infos)
 
-        self.ds_img_infos = {ds.id: api.image.get_list(ds.id) for ds in self.ds_infos}
+        # image lists are fetched dataset by dataset on first iteration in streaming mode.
+        # A list is released once its dataset is iterated and fetched again by the next pass
+        self._ds_images = {}
+        if not stream_images:
+            self._ds_images = {ds.id: self._fetch_images(ds.id) for ds in self.ds_infos}
 
-    def iterate_batched(self, batch_size: int = 50):
+    def _fetch_images(self, dataset_id: int) -> DatasetImages:
+        return DatasetImages(self._api.image.get_list(dataset_id))
+
+    def get_dataset_images(self, dataset_id: int) -> DatasetImages:
+        ds_images = self._ds_images.get(dataset_id)
+        if ds_images is None:
+            ds_images = self._ds_images[dataset_id] = self._fetch_images(dataset_id)
+        return ds_images
+
+    def release_dataset_images(self, dataset_id: int) -> None:
+        self._ds_images.pop(dataset_id, None)
+
+    def iterate_batched(self, batch_size: int = 50, batch_sizer: Optional[AdaptiveBatchSize] = None):
         for ds_info in self.ds_infos:
-            img_infos = self.ds_img_infos[ds_info.id]
-            for img_infos_batch in sly.batched(img_infos, batch_size=batch_size):
-                img_names, img_hashes, img_ids = zip(*((i.name, i.hash, i.id) for i in img_infos_batch))
-                yield ds_info, img_ids, img_hashes, img_names
+            yield from self.iterate_dataset_batched(ds_info, batch_size, batch_sizer)
+
+    def iterate_dataset_batched(self, ds_info, batch_size: int = 50,
+                                batch_sizer: Optional[AdaptiveBatchSize] = None):
+        get_batch_size = (lambda: batch_sizer.size) if batch_sizer else (lambda: batch_size)
+        ds_images = self.get_dataset_images(ds_info.id)
+        self.release_dataset_images(ds_info.id)    # kept by this generator until the last batch
+        for img_ids, img_hashes, img_names in ds_images.iterate_batched(get_batch_size):
+            yield ds_info, img_ids, img_hashes, img_names
 
     def __len__(self):
         return self._items_count
@@ -0,0 +1,147 @@
+import math
+import time
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+import supervisely as sly
+from supervisely.io.json import dump_json_file
+
+
+class Histogram:
+    # log2 buckets: bucket i holds values in (min_value * 2^(i-1), min_value * 2^i]
+    def __init__(self, min_value: float = 1e-5, buckets_cnt: int = 32):
+        self._min_value = min_value
+        self.buckets = [0] * buckets_cnt
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float):
+        idx = 0 if value <= self._min_value else math.ceil(math.log2(value / self._min_value))
+        self.buckets[min(idx, len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket containing the quantile
+        rank = q * self.count
+        seen = 0
+        for idx, cnt in enumerate(self.buckets):
+            seen += cnt
+            if seen >= rank and cnt:
+                return min(self._min_value * 2 ** idx, self.max)
+        return self.max
+
+    def to_json(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+class RunReport:
+    # Timings and counters of hot paths, safe to update from pipeline workers
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = defaultdict(float)
+        self.timings = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+        self._periodic_stop = None
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - t0)
+
+    def add_stage_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[name] += seconds
+
+    @contextmanager
+    def timed(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self.timings[name].observe(seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_counters(self, prefix: str, counters: Dict[str, int]):
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[f'{prefix}.{name}'] = value
+
+    def to_json(self) -> dict:
+        with self._lock:
+            return {
+                'stage_seconds': dict(self.stage_seconds),
+                'timings': {name: h.to_json() for name, h in sorted(self.timings.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def save(self, path: str):
+        sly.fs.ensure_base_path(path)
+        dump_json_file(self.to_json(), path)
+
+    def start_periodic_log(self, interval_seconds: float):
+        if interval_seconds <= 0 or self._periodic_stop is not None:
+            return
+        self._periodic_stop = threading.Event()
+
+        def log_periodically(stop: threading.Event):
+            while not stop.wait(interval_seconds):
+                sly.logger.info('Run report', extra=self.to_json())
+
+        threading.Thread(target=log_periodically, args=(self._periodic_stop,), name='run-report', daemon=True).start()
+
+    def stop_periodic_log(self):
+        if self._periodic_stop is not None:
+            self._periodic_stop.set()
+            self._periodic_stop = None
+
+
+_process_report = RunReport()
+_current_report = contextvars.ContextVar('run_report', default=_process_report)
+
+
+class _CurrentRunReport:
+    # Resolves to the report of the running conversion, so several projects processed in one process
+    # are reported separately. Threads started by BatchPipeline inherit the report of their creator.
+    def __getattr__(self, name):
+        return getattr(_current_report.get(), name)
+
+
+@contextmanager
+def use_run_report(report: RunReport):
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+
+run_report = _CurrentRunReport()
@@ -0,0 +1,73 @@
+import os
+import time
+from array import array
+from typing import Iterable, List, Optional
+
+import supervisely as sly
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.annotation.tag import TagJsonFields
+
+from ann_provider import AnnShardCache, serialize_ann_json
+from ann_convertor import AnnConvertor
+from run_report import run_report
+
+
+class ConversionSpool(AnnShardCache):
+    # Annotations converted during the stats pass with speculative tag set, stored as compressed shards
+    # until the conversion is committed. A spooled annotation is valid unless its labels carry a tag
+    # which is converted in one of the speculative and final tag sets only; such annotations are marked stale.
+    def __init__(self, cache_dir: str, ann_convertor: AnnConvertor, tracked_tags: Iterable[str],
+                 compress_level: int = 1):
+        super().__init__(cache_dir, compress_level)
+        self._dir = os.path.join(cache_dir, 'conversion_spool')
+        sly.fs.mkdir(self._dir, remove_content_if_exists=True)
+        self._convertor = ann_convertor
+        self.converted_img_ids = set()
+        self.multiple_tags_img_ids = set()
+        self.stale_img_ids = set()
+        # images with labels carrying each of the tags which may be in the final tag set
+        self._tag_img_ids = {tag_name: array('q') for tag_name in tracked_tags}
+
+    @property
+    def tags_to_convert(self):
+        return self._convertor.tags_to_convert
+
+    def add(self, dataset_id: int, img_ids, ann_jsons) -> None:
+        res_ann_bytes = []
+        for img_id, ann_json in zip(img_ids, ann_jsons):
+            t0 = time.perf_counter()
+            res_ann_json = self._convertor.convert_json(ann_json)
+            run_report.observe('convert', time.perf_counter() - t0)
+            if self._convertor.labels_converted:
+                self.converted_img_ids.add(img_id)
+            if self._convertor.multiple_tags_converted:
+                self.multiple_tags_img_ids.add(img_id)
+            label_tag_names = {t[TagJsonFields.TAG_NAME] for obj in ann_json.get(AnnotationJsonFields.LABELS, [])
+                               for t in obj.get(LabelJsonFields.TAGS, [])}
+            for tag_name in label_tag_names.intersection(self._tag_img_ids):
+                self._tag_img_ids[tag_name].append(img_id)
+            res_ann_bytes.append(serialize_ann_json(res_ann_json))
+        self._store_serialized(dataset_id, img_ids, res_ann_bytes)
+        run_report.count('anns_spooled', len(res_ann_bytes))
+
+    def get(self, dataset_id: int, img_ids) -> Optional[List[Optional[dict]]]:
+        # stale annotations are None, they are to be converted again
+        if not self._anns_are_stored(dataset_id, img_ids):
+            return None
+        with run_report.timed('spool.load'):
+            res_ann_jsons = self._load(dataset_id, img_ids)
+        if self.stale_img_ids:
+            res_ann_jsons = [None if img_id in self.stale_img_ids else res_ann_json
+                             for img_id, res_ann_json in zip(img_ids, res_ann_jsons)]
+        return res_ann_jsons
+
+    def invalidate(self, tag_names: List[str]) -> int:
+        # marks annotations converted differently with the final tag set as stale, returns their count
+        for tag_name in self.tags_to_convert.symmetric_difference(tag_names):
+            self.stale_img_ids.update(self._tag_img_ids.get(tag_name, ()))
+        self._tag_img_ids = {}
+        return len(self.stale_img_ids)
+
+    def remove(self):
+        sly.fs.remove_dir(self._dir)
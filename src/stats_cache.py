@@ -0,0 +1,42 @@
+import os
+import json
+import hashlib
+from typing import Optional
+
+import supervisely as sly
+from supervisely.io.json import dump_json_file, load_json_file
+
+from tags_stats import TagsStats
+
+
+class DatasetStatsCache:
+    # Tag stats of single datasets kept between runs. An entry is valid while the dataset has the same
+    # updated_at and items count and the project meta is unchanged.
+    def __init__(self, cache_dir: str, project_id: int, project_meta: sly.ProjectMeta):
+        self._dir = os.path.join(cache_dir, str(project_id))
+        sly.fs.mkdir(self._dir)
+        self._project_meta = project_meta
+        meta_str = json.dumps(project_meta.to_json(), sort_keys=True)
+        self._meta_hash = hashlib.sha1(meta_str.encode('utf-8')).hexdigest()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def _path(self, dataset_id: int) -> str:
+        return os.path.join(self._dir, f'{dataset_id}.json')
+
+    def _key(self, ds_info) -> dict:
+        return {'updated_at': ds_info.updated_at, 'items_count': ds_info.items_count, 'meta_hash': self._meta_hash}
+
+    def load(self, ds_info) -> Optional[TagsStats]:
+        path = self._path(ds_info.id)
+        entry = load_json_file(path) if os.path.isfile(path) else None
+        if entry is None or entry['key'] != self._key(ds_info):
+            self.counters['misses'] += 1
+            return None
+        self.counters['hits'] += 1
+        return TagsStats.from_json(entry['stats'], self._project_meta)
+
+    def save(self, ds_info, stats: TagsStats):
+        path = self._path(ds_info.id)
+        tmp_path = path + '.tmp'
+        dump_json_file({'key': self._key(ds_info), 'stats': stats.to_json()}, tmp_path)
+        os.replace(tmp_path, path)
@@ -1,9 +1,24 @@
 from collections import defaultdict
-from typing import Set, List
+from typing import Set, List, Iterable, Iterator, Tuple, FrozenSet, Optional
 
 import numpy as np
 
 import supervisely as sly
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.annotation.tag import TagJsonFields
+
+
+def different_shapes_error(tag_name: str) -> ValueError:
+    return ValueError(f'Inappropriate tag: associated with objects of different shapes. {tag_name=}')
+
+
+def intersected_tags_error(example: List[str]) -> ValueError:
+    guide_link = "https://developer.supervisely.com/getting-started/python-sdk-tutorials/images/image-and-object-tags#retrieve-images-with-object-tags-of-interest"
+    return ValueError(f'Found object(s) containing multiple tags from selected set. '
+                      f'Tag names example: {example}. '
+                      f'Check "Handle multiple tags on a single object" option in the modal window, or '
+                      f'see how to retrieve such images here: "{guide_link}"')
 
 
 class TagMetaChecks:
@@ -26,34 +41,198 @@ class TagMetaChecks:
         return tag_names
 
 
+class _ChunkedArray:
+    # append-only numpy array growing by preallocated chunks, no reallocation of stored data
+    def __init__(self, dtype, chunk_size: int = 1 << 12):
+        self._dtype = dtype
+        self._chunk_size = chunk_size
+        self._chunks = []
+        self._cur = np.zeros(chunk_size, dtype=dtype)
+        self._cur_len = 0
+
+    def __len__(self):
+        return len(self._chunks) * self._chunk_size + self._cur_len
+
+    def append(self, value):
+        if self._cur_len == self._chunk_size:
+            self._chunks.append(self._cur)
+            self._cur = np.zeros(self._chunk_size, dtype=self._dtype)
+            self._cur_len = 0
+        self._cur[self._cur_len] = value
+        self._cur_len += 1
+
+    def add_at(self, idx: int, value):
+        chunk_idx, pos = divmod(idx, self._chunk_size)
+        chunk = self._chunks[chunk_idx] if chunk_idx < len(self._chunks) else self._cur
+        chunk[pos] += value
+
+    def to_array(self) -> np.ndarray:
+        return np.concatenate(self._chunks + [self._cur[:self._cur_len]])
+
+
+class TagsSignatures:
+    # Objects grouped by signature (class name, set of appropriate tags) with objects count per signature.
+    # Queries cost O(unique signatures) instead of O(objects).
+    # Signatures are kept in a compact sparse storage: class names are interned as int32 codes, the tag x signature
+    # matrix is in COO form, one (signature index, tag index) entry per tag present in a signature.
+    def __init__(self, tags: Iterable[str]):
+        self.tags_sorted = list(sorted(tags))
+        self.tags_indices = {t: idx for idx, t in enumerate(self.tags_sorted)}
+        self._class_names = []
+        self._class_codes = {}
+        self._sig_indices = {}    # (class code, tag names) -> signature index, ordered by first appearance
+        self._sig_class_codes = _ChunkedArray(np.int32)
+        self._sig_counts = _ChunkedArray(np.int64)
+        self._entry_sigs = _ChunkedArray(np.int32)
+        self._entry_tags = _ChunkedArray(np.int32)
+        self._frozen = None
+
+    def add(self, class_name: str, tag_names: FrozenSet[str], count: int = 1) -> bool:
+        class_code = self._class_codes.get(class_name)
+        if class_code is None:
+            class_code = self._class_codes[class_name] = len(self._class_names)
+            self._class_names.append(class_name)
+        key = (class_code, tag_names)
+        sig_idx = self._sig_indices.get(key)
+        self._frozen = None
+        if sig_idx is not None:
+            self._sig_counts.add_at(sig_idx, count)
+            return False
+        sig_idx = self._sig_indices[key] = len(self._sig_class_codes)
+        self._sig_class_codes.append(class_code)
+        self._sig_counts.append(count)
+        for t in tag_names:
+            self._entry_sigs.append(sig_idx)
+            self._entry_tags.append(self.tags_indices[t])
+        return True
+
+    def update(self, other: 'TagsSignatures'):
+        if other.tags_sorted != self.tags_sorted:
+            raise ValueError('Unable to merge tag signatures collected for different tag sets')
+        for class_name, tag_names, count in other.items():
+            self.add(class_name, tag_names, count)
+
+    def items(self) -> Iterator[Tuple[str, FrozenSet[str], int]]:
+        _, _, sig_counts, _, _ = self._arrays()
+        for (class_code, tag_names), sig_idx in self._sig_indices.items():
+            yield self._class_names[class_code], tag_names, int(sig_counts[sig_idx])
+
+    def __len__(self):
+        return len(self._sig_indices)
+
+    def _arrays(self):
+        if self._frozen is None:
+            self._frozen = (self._class_names,
+                            self._sig_class_codes.to_array(),
+                            self._sig_counts.to_array(),
+                            self._entry_sigs.to_array(),
+                            self._entry_tags.to_array())
+        return self._frozen
+
+    @property
+    def objects_count(self) -> int:
+        _, _, sig_counts, _, _ = self._arrays()
+        return int(sig_counts.sum())
+
+    def _selected_entries(self, tag_names: List[str]) -> np.ndarray:
+        _, _, _, _, entry_tags = self._arrays()
+        tags_mask = np.zeros(len(self.tags_sorted), dtype=bool)
+        tags_mask[[self.tags_indices[t] for t in tag_names]] = True
+        return tags_mask[entry_tags]
+
+    def tags_per_signature(self, tag_names: List[str]) -> np.ndarray:
+        _, _, sig_counts, entry_sigs, _ = self._arrays()
+        return np.bincount(entry_sigs[self._selected_entries(tag_names)], minlength=len(sig_counts))
+
+    def signature_tags(self, sig_idx: int, tag_names: List[str]) -> List[str]:
+        _, _, _, entry_sigs, entry_tags = self._arrays()
+        sig_entries = (entry_sigs == sig_idx) & self._selected_entries(tag_names)
+        sig_tags = set(self.tags_sorted[idx] for idx in entry_tags[sig_entries])
+        return [t for t in tag_names if t in sig_tags]
+
+    def objects_count_of(self, sig_mask: np.ndarray) -> int:
+        _, _, sig_counts, _, _ = self._arrays()
+        return int(sig_counts[sig_mask].sum())
+
+    def class_names_of(self, sig_mask: np.ndarray) -> Set[str]:
+        class_names, sig_class_codes, _, _, _ = self._arrays()
+        return set(class_names[code] for code in np.unique(sig_class_codes[sig_mask]))
+
+    def to_json(self) -> dict:
+        return {
+            'tags': self.tags_sorted,
+            'signatures': [[class_name, sorted(tag_names), count] for class_name, tag_names, count in self.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TagsSignatures':
+        res = cls(data['tags'])
+        for class_name, tag_names, count in data['signatures']:
+            res.add(class_name, frozenset(tag_names), count)
+        return res
+
+
 class TagsStats:
-    def __init__(self, tags, tag_to_geom_types, tag_to_classes, tags_objects,
-                 obj_class_names, tags_with_images):
+    def __init__(self, tags, tag_to_geom_types, tag_to_classes, signatures: TagsSignatures, tags_with_images):
         self._tags = tags
-        self._tags_sorted = list(sorted(tags))
-        self._tags_indices = {idx: t for t, idx in enumerate(self._tags_sorted)}
         self._tag_to_geom_types = tag_to_geom_types
         self._tag_to_classes = tag_to_classes
-        self._tags_objects = tags_objects
-        self._obj_class_names = obj_class_names
+        self._signatures = signatures
         self._tags_with_images = tags_with_images
 
+    @classmethod
+    def from_signatures(cls, project_meta: sly.ProjectMeta, tags: Set[str], signatures: TagsSignatures,
+                        tags_with_images: Set[str]) -> 'TagsStats':
+        tag_to_classes = defaultdict(set)
+        for class_name, tag_names, _ in signatures.items():
+            for t in tag_names:
+                tag_to_classes[t].add(class_name)
+
+        tag_to_geom_types = defaultdict(set)
+        for tag_name, class_names in tag_to_classes.items():
+            g_types = tag_to_geom_types[tag_name]
+            for class_name in class_names:
+                cls_meta = project_meta.obj_classes.get(class_name)
+                g_types.add(cls_meta.geometry_type)
+
+        return cls(tags=tags,
+                   tag_to_geom_types=tag_to_geom_types,
+                   tag_to_classes=tag_to_classes,
+                   signatures=signatures,
+                   tags_with_images=tags_with_images)
+
+    def to_json(self) -> dict:
+        return {
+            'tags_with_images': sorted(self._tags_with_images),
+            **self._signatures.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict, project_meta: sly.ProjectMeta) -> 'TagsStats':
+        signatures = TagsSignatures.from_json(data)
+        return cls.from_signatures(project_meta, set(data['tags']), signatures, set(data['tags_with_images']))
+
+    @property
+    def signatures(self) -> TagsSignatures:
+        return self._signatures
+
+    @property
+    def tags_with_images(self) -> Set[str]:
+        return self._tags_with_images
+
     def _tags_present(self, tag_names: List[str]) -> List[str]:
         return [t for t in tag_names if t in self._tags]
 
-    def _tags_objects_sliced(self, tag_names: List[str]) -> np.ndarray:
-        indices = [self._tags_indices[t] for t in tag_names]
-        sliced = self._tags_objects[indices, :]
-        return sliced
-
-    def _tags_per_object(self, tag_names: List[str]) -> np.ndarray:
-        tags_objs_sliced = self._tags_objects_sliced(tag_names)
-        tags_per_object = tags_objs_sliced.sum(axis=0)    # np single row
-        return tags_per_object
+    def _tags_per_signature(self, tag_names: List[str]) -> np.ndarray:
+        return self._signatures.tags_per_signature(tag_names)
 
     @property
     def objects_count(self):
-        return self._tags_objects.shape[1]
+        return self._signatures.objects_count
+
+    @property
+    def signatures_count(self):
+        return len(self._signatures)
 
     def geometry_type(self, tag_name: str):  # -> type or None:
         g_types = self._tag_to_geom_types.get(tag_name, None)
@@ -61,6 +240,12 @@ class TagsStats:
             return None
         return next(iter(g_types))
 
+    def geometry_types(self, tag_name: str) -> Set[type]:
+        return set(self._tag_to_geom_types.get(tag_name, ()))
+
+    def classes(self, tag_name: str) -> Set[str]:
+        return set(self._tag_to_classes.get(tag_name, ()))
+
     def is_in_use(self, tag_name: str) -> bool:
         return len(self._tag_to_geom_types[tag_name]) > 0
 
@@ -69,33 +254,31 @@ class TagsStats:
 
     def have_not_intersected(self, tag_names: List[str]) -> bool:
         tag_names = self._tags_present(tag_names)
-        tags_per_object = self._tags_per_object(tag_names)
-        unique_tags = tags_per_object < 2
+        tags_per_signature = self._tags_per_signature(tag_names)
+        unique_tags = tags_per_signature < 2
         return np.all(unique_tags)
 
     def example_intersected(self, tag_names: List[str]) -> List[str]:
         tag_names = self._tags_present(tag_names)
-        tags_per_object = self._tags_per_object(tag_names)
-        nonunique_obj_indices = (tags_per_object >= 2).nonzero()[0]
-        if nonunique_obj_indices.size < 1:
+        tags_per_signature = self._tags_per_signature(tag_names)
+        nonunique_sig_indices = (tags_per_signature >= 2).nonzero()[0]
+        if nonunique_sig_indices.size < 1:
             return []
-        tags_obj_sliced = self._tags_objects_sliced(tag_names)
-        first_obj_with_intersection = nonunique_obj_indices[0]
-        tags_bool = tags_obj_sliced[:, first_obj_with_intersection]
-        intersected_tag_names = np.array(tag_names)[tags_bool].tolist()
+        first_sig_with_intersection = nonunique_sig_indices[0]
+        intersected_tag_names = self._signatures.signature_tags(first_sig_with_intersection, tag_names)
         return intersected_tag_names
 
     def objects_covered_cnt(self, tag_names: List[str]) -> int:
         tag_names = self._tags_present(tag_names)
-        tags_per_object = self._tags_per_object(tag_names)
-        covered = (tags_per_object > 0).sum()
+        tags_per_signature = self._tags_per_signature(tag_names)
+        covered = self._signatures.objects_count_of(tags_per_signature > 0)
         return covered
 
     def classes_not_covered_entirely(self, tag_names: List[str]) -> Set[str]:
         tag_names = self._tags_present(tag_names)
-        tags_per_object = self._tags_per_object(tag_names)
-        uncovered_row = tags_per_object == 0
-        classes = set(self._obj_class_names[uncovered_row])
+        tags_per_signature = self._tags_per_signature(tag_names)
+        uncovered_row = tags_per_signature == 0
+        classes = self._signatures.class_names_of(uncovered_row)
         return classes
 
     def tags_associated_with_images(self, tag_names: List[str]) -> Set[str]:
@@ -104,47 +287,61 @@ class TagsStats:
 
 
 class TagsStatsConstructor:
-    def __init__(self, project_meta: sly.ProjectMeta):
+    # If selected_tags are passed, fatal problems with them are raised as soon as they appear in data:
+    # a tag associated with classes of different shapes or, unless allowed, several tags on one object.
+    def __init__(self, project_meta: sly.ProjectMeta, selected_tags: Optional[List[str]] = None,
+                 allow_intersections: bool = True):
         self._project_meta = project_meta
         self._tags = TagMetaChecks.get_appropriate_tag_names(project_meta.tag_metas)
-        self._tag_to_classes = defaultdict(set)
-        self._tag_to_objects = defaultdict(list)
+        self._signatures = TagsSignatures(self._tags)
         self._tags_with_images = set()
-        self._obj_class_names = []
+
+        self._checked_tags = [t for t in selected_tags if t in self._tags] if selected_tags else []
+        self._allow_intersections = allow_intersections
+        self._checked_tag_geom_types = {}
+
+    def _check_new_signature(self, cls_name: str, tags_used: FrozenSet[str]):
+        checked_tags = [t for t in self._checked_tags if t in tags_used]
+        if not checked_tags:
+            return
+        if len(checked_tags) > 1 and not self._allow_intersections:
+            raise intersected_tags_error(checked_tags)
+        geom_type = self._project_meta.obj_classes.get(cls_name).geometry_type
+        for t in checked_tags:
+            if self._checked_tag_geom_types.setdefault(t, geom_type) != geom_type:
+                raise different_shapes_error(t)
+
+    def _update(self, img_tag_names: Iterable[str], labels: Iterable[Tuple[str, Iterable[str]]]):
+        self._tags_with_images.update(img_tag_names)
+
+        for cls_name, label_tag_names in labels:
+            tags_used = frozenset(self._tags.intersection(label_tag_names))
+            is_new = self._signatures.add(cls_name, tags_used)
+            if is_new and self._checked_tags:
+                self._check_new_signature(cls_name, tags_used)
+
+    def update_with_stats(self, stats: TagsStats):
+        # merges stats collected separately, e.g. for another dataset of the same project
+        self._tags_with_images.update(stats.tags_with_images)
+        for cls_name, tags_used, count in stats.signatures.items():
+            is_new = self._signatures.add(cls_name, tags_used, count)
+            if is_new and self._checked_tags:
+                self._check_new_signature(cls_name, tags_used)
 
     def update_with_annotation(self, ann: sly.Annotation):
-        for img_tag in ann.img_tags:
-            self._tags_with_images.add(img_tag.name)
-
-        for lbl in ann.labels:
-            cls_name = lbl.obj_class.name
-            label_tags = set(t.name for t in lbl.tags)
-            tags_used = self._tags.intersection(label_tags)
-            tags_unused = self._tags.difference(label_tags)
-            for t in tags_used:
-                self._tag_to_objects[t].append(True)
-                self._tag_to_classes[t].add(cls_name)
-            for t in tags_unused:
-                self._tag_to_objects[t].append(False)
-            self._obj_class_names.append(cls_name)
+        img_tag_names = (img_tag.name for img_tag in ann.img_tags)
+        labels = ((lbl.obj_class.name, (t.name for t in lbl.tags)) for lbl in ann.labels)
+        self._update(img_tag_names, labels)
+
+    def update_with_annotation_json(self, ann_json: dict):
+        # same as update_with_annotation, but geometries are never decoded
+        def tag_names(tag_jsons):
+            return (t[TagJsonFields.TAG_NAME] for t in tag_jsons)
+
+        img_tag_names = tag_names(ann_json.get(AnnotationJsonFields.IMG_TAGS, []))
+        labels = ((obj[LabelJsonFields.OBJ_CLASS_NAME], tag_names(obj.get(LabelJsonFields.TAGS, [])))
+                  for obj in ann_json.get(AnnotationJsonFields.LABELS, []))
+        self._update(img_tag_names, labels)
 
     def get_stats(self) -> TagsStats:
-        tag_to_geom_types = defaultdict(set)
-        for tag_name, class_names in self._tag_to_classes.items():
-            g_types = tag_to_geom_types[tag_name]
-            for class_name in class_names:
-                cls = self._project_meta.obj_classes.get(class_name)
-                g_types.add(cls.geometry_type)
-
-        tags_sorted = list(sorted(self._tags))
-        list_to_table = [self._tag_to_objects[t] for t in tags_sorted]
-        tags_objects = np.array(list_to_table, dtype=np.bool)
-
-        obj_class_names = np.array(self._obj_class_names)
-        res = TagsStats(tags=self._tags,
-                        tag_to_geom_types=tag_to_geom_types,
-                        tag_to_classes=self._tag_to_classes,
-                        tags_objects=tags_objects,
-                        obj_class_names=obj_class_names,
-                        tags_with_images=self._tags_with_images)
-        return res
+        return TagsStats.from_signatures(self._project_meta, self._tags, self._signatures, self._tags_with_images)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+root_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(root_directory, 'src'))
+sys.path.append(os.path.join(root_directory, 'benchmarks'))    # fake api and http server
@@ -0,0 +1,147 @@
+import copy
+
+import pytest
+import supervisely as sly
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.geometry.constants import GEOMETRY_SHAPE
+
+from ann_convertor import AnnConvertor, LABEL_SERVER_FIELDS, TAG_SERVER_FIELDS
+
+
+SELECTED_TAGS = ['car', 'truck']
+
+# project meta as the server returns it: classes and tag metas have ids
+SERVER_META_JSON = {
+    'classes': [
+        {'id': 101, 'title': 'vehicle', 'shape': 'rectangle', 'color': '#FF0000', 'geometry_config': {}},
+        {'id': 102, 'title': 'outline', 'shape': 'polygon', 'color': '#00FF00', 'geometry_config': {}},
+    ],
+    'tags': [
+        {'id': 201, 'name': 'car', 'value_type': 'none', 'color': '#0000FF'},
+        {'id': 202, 'name': 'truck', 'value_type': 'none', 'color': '#00FFFF'},
+        {'id': 203, 'name': 'checked', 'value_type': 'none', 'color': '#FFFF00'},
+        {'id': 204, 'name': 'comment', 'value_type': 'any_string', 'color': '#FF00FF'},
+    ],
+}
+
+
+def server_tag(tag_id: int, name: str, tag_meta_id: int, value=None) -> dict:
+    return {'id': tag_id, 'tagId': tag_meta_id, 'name': name, 'value': value, 'labelerLogin': 'annotator',
+            'createdAt': '2023-01-10T10:00:00.000Z', 'updatedAt': '2023-01-11T10:00:00.000Z'}
+
+
+def server_object(obj_id: int, class_id: int, class_title: str, geometry: dict, tags: list) -> dict:
+    return {'id': obj_id, 'classId': class_id, 'classTitle': class_title, 'description': '', 'tags': tags,
+            'labelerLogin': 'annotator', 'createdAt': '2023-01-10T10:00:00.000Z',
+            'updatedAt': '2023-01-11T10:00:00.000Z', 'nnCreated': False, 'nnUpdated': False, **geometry}
+
+
+RECTANGLE = {'geometryType': 'rectangle', 'points': {'exterior': [[10, 20], [50, 60]], 'interior': []}}
+POLYGON = {'geometryType': 'polygon', 'points': {'exterior': [[1, 1], [40, 2], [30, 35]], 'interior': []}}
+
+# annotation as the server returns it: objects and tags have ids of the source project
+SERVER_ANN_JSON = {
+    'description': '',
+    'size': {'height': 100, 'width': 120},
+    'tags': [
+        server_tag(1, 'checked', 203),
+        server_tag(2, 'comment', 204, value='night shot'),
+    ],
+    'objects': [
+        server_object(11, 101, 'vehicle', RECTANGLE, []),
+        server_object(12, 101, 'vehicle', RECTANGLE, [server_tag(3, 'car', 201)]),
+        server_object(13, 101, 'vehicle', RECTANGLE, [server_tag(4, 'truck', 202),
+                                                      server_tag(5, 'comment', 204, value='far')]),
+        server_object(14, 101, 'vehicle', RECTANGLE, [server_tag(6, 'checked', 203), server_tag(7, 'car', 201),
+                                                      server_tag(8, 'truck', 202)]),
+        server_object(15, 102, 'outline', POLYGON, [server_tag(9, 'checked', 203)]),
+    ],
+    'customBigData': {},
+}
+
+
+def make_res_meta(src_meta: sly.ProjectMeta) -> sly.ProjectMeta:
+    new_classes = [sly.ObjClass(t, sly.Rectangle) for t in SELECTED_TAGS]
+    res_tags = [t.clone() for t in src_meta.tag_metas if t.name not in SELECTED_TAGS]
+    return src_meta.clone(obj_classes=src_meta.obj_classes.add_items(new_classes),
+                          tag_metas=sly.TagMetaCollection(res_tags))
+
+
+def canonical(ann_json: dict) -> dict:
+    # "shape" is a duplicate of "geometryType" which sly.Label.to_json() always adds
+    res = copy.deepcopy(ann_json)
+    for obj in res[AnnotationJsonFields.LABELS]:
+        obj.pop(GEOMETRY_SHAPE, None)
+    return res
+
+
+@pytest.fixture
+def src_meta() -> sly.ProjectMeta:
+    return sly.ProjectMeta.from_json(SERVER_META_JSON)
+
+
+@pytest.fixture(params=['ignore', 'create'])
+def convertor(request, src_meta) -> AnnConvertor:
+    return AnnConvertor(SELECTED_TAGS, src_meta=src_meta, res_meta=make_res_meta(src_meta),
+                        handle_option=request.param)
+
+
+def test_json_path_equals_object_path(convertor, src_meta):
+    by_objects = convertor.convert(sly.Annotation.from_json(SERVER_ANN_JSON, src_meta)).to_json()
+    flags_by_objects = convertor.labels_converted, convertor.multiple_tags_converted
+    by_json = convertor.convert_json(SERVER_ANN_JSON)
+    flags_by_json = convertor.labels_converted, convertor.multiple_tags_converted
+
+    assert canonical(by_json) == canonical(by_objects)
+    assert flags_by_json == flags_by_objects == (True, True)
+
+
+@pytest.mark.parametrize('path', ['objects', 'json'])
+def test_server_ids_are_dropped(convertor, src_meta, path):
+    if path == 'objects':
+        res = convertor.convert(sly.Annotation.from_json(SERVER_ANN_JSON, src_meta)).to_json()
+    else:
+        res = convertor.convert_json(SERVER_ANN_JSON)
+
+    for obj in res[AnnotationJsonFields.LABELS]:
+        assert not LABEL_SERVER_FIELDS.intersection(obj)
+        for tag in obj[LabelJsonFields.TAGS]:
+            assert not TAG_SERVER_FIELDS.intersection(tag)
+    for tag in res[AnnotationJsonFields.IMG_TAGS]:
+        assert not TAG_SERVER_FIELDS.intersection(tag)
+
+
+def test_multiple_tags_handling(convertor):
+    res = convertor.convert_json(SERVER_ANN_JSON)
+    class_titles = [obj[LabelJsonFields.OBJ_CLASS_NAME] for obj in res[AnnotationJsonFields.LABELS]]
+    if convertor.ignore_multiple_tags:
+        assert class_titles == ['vehicle', 'car', 'truck', 'car', 'outline']
+    else:
+        assert class_titles == ['vehicle', 'car', 'truck', 'car', 'truck', 'outline']
+
+
+def test_ignore_keeps_first_tag_of_label(convertor):
+    obj = SERVER_ANN_JSON['objects'][3]    # checked, car, truck
+    reordered = {**obj, 'tags': list(reversed(obj['tags']))}
+    res = convertor.convert_json({**SERVER_ANN_JSON, 'objects': [obj, reordered]})
+
+    class_titles = [o[LabelJsonFields.OBJ_CLASS_NAME] for o in res[AnnotationJsonFields.LABELS]]
+    if convertor.ignore_multiple_tags:
+        assert class_titles == ['car', 'truck']
+        assert [[t['name'] for t in o['tags']] for o in res[AnnotationJsonFields.LABELS]] == [
+            ['checked', 'truck'], ['car', 'checked']]
+    else:
+        assert class_titles == ['car', 'truck', 'truck', 'car']
+
+
+def test_rewrites_are_memoized_by_selected_tags(convertor):
+    convertor.convert_json(SERVER_ANN_JSON)
+    # (), (car,), (truck,), (car, truck)
+    assert convertor.memo_counters['misses'] == 4
+
+
+def test_source_json_is_not_changed(convertor):
+    src = copy.deepcopy(SERVER_ANN_JSON)
+    convertor.convert_json(src)
+    assert src == SERVER_ANN_JSON
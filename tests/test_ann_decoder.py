@@ -0,0 +1,55 @@
+import os
+import sys
+import subprocess
+import textwrap
+
+import pytest
+import supervisely as sly
+
+from synthetic import make_meta, make_ann_jsons
+from ann_decoder import AnnDecoderPool
+
+
+@pytest.mark.parametrize('geometry', ['bitmap', 'polygon'])
+def test_pool_decodes_same_annotations(geometry):
+    meta = make_meta(3, geometry=geometry)
+    ann_jsons = make_ann_jsons(meta, 10, 3, obj_size=32)
+    pool = AnnDecoderPool(meta, processes=2, chunk_size=3)
+    try:
+        anns = list(pool.decode(ann_jsons))
+    finally:
+        pool.close()
+
+    assert [ann.to_json() for ann in anns] == [sly.Annotation.from_json(j, meta).to_json() for j in ann_jsons]
+    if geometry == 'bitmap':
+        assert all(label.geometry.data.dtype == bool for ann in anns for label in ann.labels)
+
+
+def test_workers_do_not_create_app_and_api(tmp_path):
+    # workers import the entry point module again; the app settings must not start the web app there
+    script = tmp_path / 'entry.py'
+    script.write_text(textwrap.dedent('''
+        import os
+        import globals as g
+        from synthetic import make_meta, make_ann_jsons
+        from ann_decoder import AnnDecoderPool
+
+        print('IMPORT', __name__, 'app' in vars(g) or 'api' in vars(g), flush=True)
+
+        if __name__ == '__main__':
+            meta = make_meta(2, geometry='bitmap')
+            pool = AnnDecoderPool(meta, processes=2)
+            assert len(list(pool.decode(make_ann_jsons(meta, 4, 2, obj_size=8)))) == 4
+            pool.close()
+    '''))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path), 'TASK_ID': '0', 'context.teamId': '1',
+           'context.workspaceId': '1', 'modal.state.selectedTags.tags': '[]', 'modal.state.handleMulti': 'false',
+           'SERVER_ADDRESS': 'http://localhost', 'API_TOKEN': 'x' * 128, 'LAZY_STARTUP': 'false',
+           'DEBUG_APP_DIR': str(tmp_path / 'data'), 'DEBUG_TEMPORARY_APP_DIR': str(tmp_path / 'temp')}
+    res = subprocess.run([sys.executable, str(script)], env=env, capture_output=True, text=True, timeout=120)
+    assert res.returncode == 0, res.stderr
+
+    imports = [line.split()[1:] for line in res.stdout.splitlines() if line.startswith('IMPORT')]
+    assert ['__main__', 'True'] in imports
+    assert ['__mp_main__', 'True'] not in imports
+    assert ['__mp_main__', 'False'] in imports
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from fake_api import FakeApi
+from fake_http_server import FakeHttpServer
+from async_api import AsyncApiBridge
+
+
+IMAGES_CNT = 40
+
+
+def make_ann_json(idx: int) -> dict:
+    return {'description': '', 'size': {'height': 10, 'width': 10}, 'tags': [], 'customBigData': {},
+            'objects': [{'classTitle': f'class_{idx % 3}', 'description': '', 'tags': [], 'geometryType': 'point',
+                         'points': {'exterior': [[idx, idx]], 'interior': []}}]}
+
+
+@pytest.fixture
+def api() -> FakeApi:
+    api = FakeApi()
+    api.add_project(1, 'src', {'classes': [], 'tags': []}, {'ds': [make_ann_json(i) for i in range(IMAGES_CNT)]})
+    return api
+
+
+def get_dataset(api: FakeApi, name: str):
+    return next(ds for ds in api.storage.datasets.values() if ds.name == name)
+
+
+def create_bridge(api: FakeApi, server: FakeHttpServer, **client_kwargs) -> AsyncApiBridge:
+    api.server_address = server.address
+    kwargs = {'retries': 8, 'backoff_seconds': 0.001, 'request_batch_size': 4, **client_kwargs}
+    return AsyncApiBridge.from_api(api, **kwargs)
+
+
+@pytest.mark.parametrize('fail_rate, lost_reply_rate', [(0.0, 0.0), (0.3, 0.0), (0.0, 0.3), (0.2, 0.2)])
+def test_download_is_retried(api, fail_rate, lost_reply_rate):
+    src_ds = get_dataset(api, 'ds')
+    img_ids = api.storage.dataset_images[src_ds.id]
+    with FakeHttpServer(api, fail_rate=fail_rate, lost_reply_rate=lost_reply_rate, seed=1) as server:
+        bridge = create_bridge(api, server)
+        try:
+            infos = bridge.annotation.download_batch(src_ds.id, img_ids)
+        finally:
+            bridge.close()
+
+    assert [info.image_id for info in infos] == img_ids
+    assert [info.annotation for info in infos] == [make_ann_json(i) for i in range(IMAGES_CNT)]
+    assert (server.failed_requests + server.lost_replies > 0) == (fail_rate + lost_reply_rate > 0)
+
+
+@pytest.mark.parametrize('fail_rate, lost_reply_rate', [(0.0, 0.0), (0.3, 0.0), (0.0, 0.3), (0.2, 0.2)])
+def test_writes_are_not_duplicated_and_keep_order(api, fail_rate, lost_reply_rate):
+    src_ds = get_dataset(api, 'ds')
+    src_img_ids = api.storage.dataset_images[src_ds.id]
+    names = [api.storage.images[img_id].name for img_id in src_img_ids]
+    res_ds = api.dataset.create(api.project.create(1, 'res').id, 'ds')
+    res_ann_jsons = [make_ann_json(i + 100) for i in range(IMAGES_CNT)]
+    with FakeHttpServer(api, fail_rate=fail_rate, lost_reply_rate=lost_reply_rate, seed=1) as server:
+        bridge = create_bridge(api, server)
+        try:
+            res_infos = bridge.image.upload_ids(res_ds.id, names=names, ids=src_img_ids)
+            bridge.annotation.upload_jsons([info.id for info in res_infos], res_ann_jsons)
+        finally:
+            bridge.close()
+
+    res_img_ids = api.storage.dataset_images[res_ds.id]
+    assert [info.id for info in res_infos] == res_img_ids
+    assert [api.storage.images[img_id].name for img_id in res_img_ids] == names
+    assert [json.loads(api.storage.anns[img_id]) for img_id in res_img_ids] == res_ann_jsons
+    if lost_reply_rate > 0:
+        assert server.lost_replies > 0
+
+
+def test_retries_are_limited(api):
+    src_ds = get_dataset(api, 'ds')
+    res_ds = api.dataset.create(api.project.create(1, 'res').id, 'ds')
+    with FakeHttpServer(api, fail_rate=1.0) as server:
+        bridge = create_bridge(api, server, retries=2)
+        try:
+            with pytest.raises(RuntimeError, match='after 3 attempts'):
+                bridge.annotation.download_batch(src_ds.id, api.storage.dataset_images[src_ds.id])
+            with pytest.raises(RuntimeError, match='after 3 attempts'):
+                bridge.image.upload_ids(res_ds.id, names=['a.jpg'], ids=api.storage.dataset_images[src_ds.id][:1])
+        finally:
+            bridge.close()
+    assert api.storage.dataset_images[res_ds.id] == []
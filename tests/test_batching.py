@@ -0,0 +1,24 @@
+from batching import AdaptiveBatchSize
+
+
+def test_reading_size_does_not_count_batches():
+    sizer = AdaptiveBatchSize('test', initial=20)
+    assert [sizer.size for _ in range(3)] == [20, 20, 20]
+    assert sizer.summary() == {'batches': 0}
+
+
+def test_summary_of_recorded_batches():
+    sizer = AdaptiveBatchSize('test', initial=20, max_size=100, target_seconds=1.0)
+    for items_cnt in (20, 40, 7):
+        sizer.record(items_cnt, None, seconds=0.1)
+
+    summary = sizer.summary()
+    assert (summary['batches'], summary['min_size'], summary['max_size']) == (3, 7, 40)
+    assert summary['mean_size'] == 67 / 3
+    assert summary['last_size'] == sizer.size == 100
+
+
+def test_size_follows_payload_limit():
+    sizer = AdaptiveBatchSize('test', initial=50, max_payload_bytes=1000)
+    sizer.record(50, 50 * 100, seconds=0.1)
+    assert sizer.size == 10
@@ -0,0 +1,70 @@
+import gc
+
+from memory_watchdog import MemoryWatchdog, acquire_memory_watchdog, release_memory_watchdog
+
+
+class FakeCache:
+    def __init__(self, memory_bytes: int):
+        self.memory_bytes = memory_bytes
+
+    def set_memory_budget(self, budget: int):
+        self.memory_bytes = min(self.memory_bytes, budget)
+
+
+def test_one_watchdog_per_process():
+    first = acquire_memory_watchdog(0.8, 0.9, interval_seconds=10.0, limit_bytes=1 << 40)
+    second = acquire_memory_watchdog(0.8, 0.9, interval_seconds=10.0, limit_bytes=1 << 40)
+    assert first is second
+
+    release_memory_watchdog(first)
+    assert acquire_memory_watchdog(0.8, 0.9, interval_seconds=10.0, limit_bytes=1 << 40) is first
+    release_memory_watchdog(first)
+    release_memory_watchdog(second)
+    # stopped with the last user, the next conversion starts a new one
+    third = acquire_memory_watchdog(0.8, 0.9, interval_seconds=10.0, limit_bytes=1 << 40)
+    assert third is not first
+    release_memory_watchdog(third)
+
+
+def test_disabled_watchdog():
+    assert acquire_memory_watchdog(0.8, 0.9, interval_seconds=0) is None
+
+
+def test_all_watched_caches_are_downgraded():
+    watchdog = MemoryWatchdog(soft_bytes=1, hard_bytes=1)
+    caches = [FakeCache(100), FakeCache(200)]
+    for cache in caches:
+        watchdog.watch(cache)
+    unwatched = FakeCache(300)
+    watchdog.watch(unwatched)
+    watchdog.unwatch(unwatched)
+
+    assert watchdog.check() == 'hard'
+    assert [c.memory_bytes for c in caches] == [0, 0]
+    assert unwatched.memory_bytes == 300
+
+
+def test_caches_are_not_kept_alive():
+    watchdog = MemoryWatchdog(soft_bytes=1 << 40, hard_bytes=1 << 40)
+    watchdog.watch(FakeCache(100))
+    gc.collect()
+    assert not list(watchdog._caches)
+
+
+def test_next_conversion_starts_from_normal_level():
+    watchdog = acquire_memory_watchdog(0.8, 0.9, interval_seconds=10.0, limit_bytes=1 << 40)
+    try:
+        first_cache = FakeCache(100)
+        watchdog.watch(first_cache)
+        watchdog._soft_bytes = watchdog._hard_bytes = 1    # a memory-heavy conversion
+        assert watchdog.check() == 'hard'
+        watchdog._soft_bytes = watchdog._hard_bytes = 1 << 40    # its memory is freed
+        assert acquire_memory_watchdog(0.8, 0.9, interval_seconds=10.0) is watchdog
+        release_memory_watchdog(watchdog)
+
+        next_cache = FakeCache(100)
+        watchdog.watch(next_cache)
+        assert watchdog.level == 'normal'
+        assert (first_cache.memory_bytes, next_cache.memory_bytes) == (0, 100)
+    finally:
+        release_memory_watchdog(watchdog)
@@ -0,0 +1,31 @@
+from fake_api import FakeApi
+from synthetic import make_meta, make_datasets
+from project_commons import ProjectCommons
+
+
+def make_project(stream_images: bool):
+    meta = make_meta(2, geometry='polygon')
+    api = FakeApi()
+    datasets = make_datasets(meta, 25, 2, 1, obj_size=8)
+    src = api.add_project(1, 'synthetic', meta.to_json(), datasets)
+    return api, ProjectCommons(api, src.id, stream_images=stream_images)
+
+
+def test_batches_keep_image_fields():
+    api, project = make_project(stream_images=True)
+    for ds_info, img_ids, img_hashes, img_names in project.iterate_batched(batch_size=4):
+        assert len(img_ids) <= 4
+        for img_id, img_hash, img_name in zip(img_ids, img_hashes, img_names):
+            img_info = api.storage.images[img_id]
+            assert (img_info.dataset_id, img_info.hash, img_info.name) == (ds_info.id, img_hash, img_name)
+    assert sum(1 for _ in project.iterate_batched(batch_size=4)) == 4 + 3
+
+
+def test_image_lists_are_released_after_iteration():
+    api, project = make_project(stream_images=False)
+    for _ in project.iterate_batched():
+        pass
+    assert not project._ds_images
+
+    list(project.iterate_batched())
+    assert api.network.requests['image.get_list'] == 2 * len(project.ds_infos)
@@ -0,0 +1,48 @@
+from synthetic import make_meta, make_ann_jsons
+from ann_convertor import AnnConvertor
+from spool import ConversionSpool
+
+
+DATASET_ID = 1
+
+
+def label_tag_names(ann_json: dict) -> set:
+    return {t['name'] for obj in ann_json['objects'] for t in obj['tags']}
+
+
+def make_spool(tmp_path, meta, tag_names, tracked_tags) -> ConversionSpool:
+    convertor = AnnConvertor(tag_names, src_meta=meta, res_meta=meta, handle_option='create')
+    return ConversionSpool(str(tmp_path), convertor, tracked_tags=tracked_tags)
+
+
+def test_only_annotations_with_changed_tags_are_stale(tmp_path):
+    meta = make_meta(4, geometry='polygon')
+    ann_jsons = make_ann_jsons(meta, 40, 3, obj_size=16, tags_per_label=0.5)
+    img_ids = list(range(100, 100 + len(ann_jsons)))
+    spool = make_spool(tmp_path, meta, ['tag_0', 'tag_1'], tracked_tags=['tag_0', 'tag_1', 'tag_2'])
+    spool.add(DATASET_ID, img_ids, ann_jsons)
+
+    # tag_1 is dropped and tag_2 is added by validation
+    stale_cnt = spool.invalidate(['tag_0', 'tag_2'])
+    res_ann_jsons = spool.get(DATASET_ID, img_ids)
+
+    final_convertor = AnnConvertor(['tag_0', 'tag_2'], src_meta=meta, res_meta=meta, handle_option='create')
+    expected_stale = [img_id for img_id, ann_json in zip(img_ids, ann_jsons)
+                      if label_tag_names(ann_json) & {'tag_1', 'tag_2'}]
+    assert 0 < stale_cnt == len(expected_stale) < len(img_ids)
+    for img_id, ann_json, res_ann_json in zip(img_ids, ann_jsons, res_ann_jsons):
+        if img_id in expected_stale:
+            assert res_ann_json is None
+        else:
+            assert res_ann_json == final_convertor.convert_json(ann_json)
+
+
+def test_same_tag_set_keeps_all_annotations(tmp_path):
+    meta = make_meta(3, geometry='polygon')
+    ann_jsons = make_ann_jsons(meta, 10, 3, obj_size=16)
+    img_ids = list(range(len(ann_jsons)))
+    spool = make_spool(tmp_path, meta, ['tag_0', 'tag_1'], tracked_tags=['tag_0', 'tag_1'])
+    spool.add(DATASET_ID, img_ids, ann_jsons)
+
+    assert spool.invalidate(['tag_1', 'tag_0']) == 0
+    assert None not in spool.get(DATASET_ID, img_ids)